@@ -0,0 +1,135 @@
+"""
+IVF (inverted file) approximate nearest-neighbour index in plain NumPy.
+
+Training runs spherical k-means over the (unit-length) chunk embeddings, so
+every chunk belongs to the list of its nearest centroid. A query only scores
+the chunks in its `nprobe` closest lists instead of the whole corpus.
+
+Stored next to the index files of a generation:
+
+    ivf_centroids.npy   (n_lists, dim) float32, unit-length rows
+    ivf_rows.npy        chunk rows, grouped by list
+    ivf_offsets.npy     (n_lists + 1,) start of each list in ivf_rows.npy
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+CENTROIDS = "ivf_centroids"
+ROWS = "ivf_rows"
+OFFSETS = "ivf_offsets"
+
+# Rows scored per block while assigning, to bound temporary memory
+_BLOCK = 8192
+
+
+def default_n_lists(n_chunks: int) -> int:
+    """Rule of thumb: about sqrt(n) lists, none for small corpora."""
+    if n_chunks < 5000:
+        return 0
+    return int(round(np.sqrt(n_chunks)))
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=1, keepdims=True) + 1e-10)
+
+
+def _assign(embs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for every row."""
+    out = np.empty(embs.shape[0], dtype=np.int32)
+    for start in range(0, embs.shape[0], _BLOCK):
+        block = np.asarray(embs[start:start + _BLOCK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def train_ivf(
+    embs: np.ndarray,
+    n_lists: int,
+    iters: int = 20,
+    max_train_points: int = 256,
+    seed: int = 0,
+) -> Dict[str, np.ndarray]:
+    """
+    Train an IVF index over unit-length embeddings.
+
+    Args:
+        embs: (n, dim) float32 matrix with L2-normalized rows.
+        n_lists: Number of inverted lists (k-means clusters).
+        iters: k-means iterations.
+        max_train_points: k-means trains on at most this many points per
+                          list (a random sample), then assigns every row.
+        seed: Random seed, so rebuilding the same corpus gives the same index.
+
+    Returns:
+        {"ivf_centroids", "ivf_rows", "ivf_offsets"} arrays, ready to be
+        stored with the index (see index_store.publish_index).
+    """
+    n = embs.shape[0]
+    n_lists = max(1, min(n_lists, n))
+    rng = np.random.default_rng(seed)
+
+    n_train = min(n, n_lists * max_train_points)
+    train = np.asarray(embs[np.sort(rng.choice(n, size=n_train, replace=False))], dtype=np.float32)
+    centroids = train[rng.choice(n_train, size=n_lists, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(train, centroids)
+
+        # New centroid = normalized sum of its members (spherical k-means)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=n_lists)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(train[order], starts[nonempty], axis=0)
+
+        # Re-seed empty lists with random training points
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            sums[empty] = train[rng.choice(n_train, size=len(empty), replace=False)]
+        centroids = _normalize(sums).astype(np.float32)
+
+    assign = _assign(embs, centroids)
+    rows = np.argsort(assign, kind="stable").astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists)))).astype(np.int64)
+    return {CENTROIDS: centroids, ROWS: rows, OFFSETS: offsets}
+
+
+class IVFIndex:
+    """
+    Read side of an IVF index.
+
+    Args:
+        centroids: (n_lists, dim) unit-length centroids.
+        rows: Chunk rows grouped by list.
+        offsets: Start of each list in `rows` (length n_lists + 1).
+    """
+
+    def __init__(self, centroids: np.ndarray, rows: np.ndarray, offsets: np.ndarray):
+        self.centroids = centroids
+        self.rows = rows
+        self.offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Optional[np.ndarray]]) -> Optional["IVFIndex"]:
+        """Build from stored arrays; None if the index has no IVF data."""
+        if any(arrays.get(k) is None for k in (CENTROIDS, ROWS, OFFSETS)):
+            return None
+        return cls(arrays[CENTROIDS], arrays[ROWS], arrays[OFFSETS])
+
+    @property
+    def n_lists(self) -> int:
+        return int(self.centroids.shape[0])
+
+    def candidates(self, q: np.ndarray, nprobe: int) -> np.ndarray:
+        """Rows in the `nprobe` lists whose centroids are closest to q."""
+        nprobe = max(1, min(nprobe, self.n_lists))
+        sims = self.centroids @ q
+        if nprobe < self.n_lists:
+            probes = np.argpartition(-sims, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.n_lists)
+        return np.concatenate(
+            [self.rows[self.offsets[l]:self.offsets[l + 1]] for l in probes]
+        )
@@ -0,0 +1,92 @@
+"""
+Request coalescing for the chat path.
+
+MicroBatcher collects calls that arrive within a short window (or until a
+batch is full) and hands them to one batched function: concurrent query
+embeddings become one /api/embed call, and concurrent searches one
+matrix-matrix product. Each caller gets its own result back.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple
+
+from metrics import REGISTRY, Histogram
+
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "hr_batch_size", "Calls coalesced into one batch.", ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent calls into batches.
+
+    Only calls with the same key share a batch (e.g. searches over the same
+    index with the same doc filter). A batch is run when it holds max_batch
+    calls, or `window` seconds after its first call arrived, so a lone call
+    waits at most `window`.
+
+    Args:
+        name: Label for the hr_batch_size metric.
+        run: async run(key, items) -> one result per item, in order.
+        max_batch: Largest batch.
+        window: Seconds to wait for more calls after the first one.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[Hashable, List[Any]], Awaitable[List[Any]]],
+        max_batch: int,
+        window: float,
+    ):
+        self.name = name
+        self.run = run
+        self.max_batch = max(max_batch, 1)
+        self.window = window
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any, key: Hashable = None) -> Any:
+        """Add one call to the current batch for key and wait for its result."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        batch = self._pending.setdefault(key, [])
+        batch.append((item, fut))
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self._timers[key] = loop.call_later(self.window, self._flush, key)
+        return await fut
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(key, None)
+        if not batch:
+            return
+        # Keep a reference, so the task is not garbage-collected mid-run
+        task = asyncio.ensure_future(self._run_batch(key, batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, key: Hashable, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        BATCH_SIZE.observe(len(batch), batcher=self.name)
+        try:
+            results = await self.run(key, [item for item, _ in batch])
+        except asyncio.CancelledError:
+            for _, fut in batch:
+                fut.cancel()
+            raise
+        except Exception as e:
+            # Every caller in the batch sees the failure
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for (_, fut), result in zip(batch, results):
+            # A caller that went away has a cancelled future
+            if not fut.done():
+                fut.set_result(result)
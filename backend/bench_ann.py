@@ -0,0 +1,110 @@
+"""
+Recall@k and latency of IVF search (ann.py) against exact brute-force search.
+
+Queries are taken from the index itself (a random sample of chunk embeddings
+plus a little noise), so no Ollama server is needed.
+
+Usage (from the backend folder):
+    python bench_ann.py                          # the live index in data/index
+    python bench_ann.py --synthetic 50000        # a random clustered corpus
+    python bench_ann.py --nprobe 1 2 4 8 16 32 --doc-filter
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from ann import CENTROIDS, default_n_lists, train_ivf
+from index_store import load_index, write_index
+from retrieval import RetrievalEngine
+
+
+def synthetic_index(out_dir: str, n: int, dim: int, n_docs: int, seed: int = 0):
+    """Write a clustered random corpus (n chunks over n_docs docs) to out_dir."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(n // 50, 1), dim)).astype(np.float32)
+    embs = centers[rng.integers(len(centers), size=n)]
+    embs += 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    per_doc = -(-n // n_docs)
+    chunks = [
+        {"id": f"doc{i // per_doc}-chunk-{i}", "doc_id": f"doc{i // per_doc}", "text": ""}
+        for i in range(n)
+    ]
+    write_index(out_dir, chunks, embs, model="synthetic")
+
+
+def time_queries(engine: RetrievalEngine, queries: np.ndarray, top_k: int, doc_ids):
+    """Run every query once; return (results, milliseconds per query)."""
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        results.append([row for row, _ in engine.search(q, top_k=top_k, doc_ids=doc_ids)])
+    ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, ms
+
+
+def recall(exact, approx, top_k: int) -> float:
+    """Share of the exact top_k rows that the approximate search found."""
+    found = sum(len(set(e) & set(a)) for e, a in zip(exact, approx))
+    total = sum(min(len(e), top_k) for e in exact)
+    return found / total if total else 1.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", default="data/index", help="index root or directory")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark a random corpus of this many chunks instead")
+    parser.add_argument("--dim", type=int, default=768, help="dimension for --synthetic")
+    parser.add_argument("--lists", type=int, default=None,
+                        help="IVF lists to train if the index has none (default: ~sqrt(n))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    parser.add_argument("--doc-filter", action="store_true",
+                        help="also restrict all queries to the doc of the first sampled chunk")
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    if args.synthetic:
+        synthetic_index(tmp.name, args.synthetic, args.dim, n_docs=20)
+        index = load_index(tmp.name)
+    else:
+        index = load_index(args.index)
+
+    # Train an IVF index on the fly if the stored one is missing
+    if index.array(CENTROIDS) is None:
+        n_lists = args.lists or default_n_lists(len(index)) or max(int(np.sqrt(len(index))), 1)
+        t0 = time.perf_counter()
+        arrays = train_ivf(np.asarray(index.embeddings), n_lists)
+        print(f"Trained {n_lists} IVF lists in {time.perf_counter() - t0:.1f}s")
+        chunks = [index.chunk(i) for i in range(len(index))]
+        ivf_dir = os.path.join(tmp.name, "ivf")
+        write_index(ivf_dir, chunks, index.embeddings, model=index.meta.get("model", ""), arrays=arrays)
+        index = load_index(ivf_dir)
+
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(index), size=min(args.queries, len(index)), replace=False)
+    queries = np.asarray(index.embeddings[rows], dtype=np.float32)
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    exact = RetrievalEngine(index)
+    n_lists = len(index.array(CENTROIDS))
+    print(f"{len(index)} chunks, {index.dim} dims, {n_lists} IVF lists, "
+          f"{len(queries)} queries, top_k={args.top_k}")
+
+    for label, filtered in [("all docs", False), ("one doc", True)]:
+        if filtered and not args.doc_filter:
+            continue
+        # One doc filter per query would change the work per query; use the
+        # doc of the first sampled row for all of them
+        doc_ids = [index.doc_ids[rows[0]]] if filtered else None
+        truth, exact_ms = time_queries(exact, queries, args.top_k, doc_ids)
+        print(f"\n[{label}]  exact: {exact_ms:.3f} ms/query")
+        print(f"{'nprobe':>8} {'recall@k':>9} {'ms/query':>9} {'speedup':>8}")
+        for nprobe in args.nprobe:
+            approx, ms = time_queries(RetrievalEngine(index, nprobe=nprobe), queries, args.top_k, doc_ids)
+            print(f"{nprobe:>8} {recall(truth, approx, args.top_k):>9.3f} "
+                  f"{ms:>9.3f} {exact_ms / ms:>7.1f}x")
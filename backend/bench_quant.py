@@ -0,0 +1,82 @@
+"""
+Recall@k, latency and scan size of quantized search (quantize.py) against the
+original float64 brute-force path (np.array over the JSON embeddings).
+
+Queries are taken from the index itself (a random sample of chunk embeddings
+plus a little noise), so no Ollama server is needed.
+
+Usage (from the backend folder):
+    python bench_quant.py                        # the live index in data/index
+    python bench_quant.py --synthetic 50000      # a random clustered corpus
+    python bench_quant.py --rescore 1 2 4 8 16
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from bench_ann import recall, synthetic_index, time_queries
+from index_store import load_index, write_index
+from quantize import quantize_embeddings
+from retrieval import RetrievalEngine
+
+
+def float64_search(embs64: np.ndarray, queries: np.ndarray, top_k: int):
+    """The pre-index path: float64 cosine similarity plus a full argsort."""
+    results = []
+    start = time.perf_counter()
+    for q in queries:
+        q = q.astype(np.float64)
+        sims = embs64 @ q / (np.linalg.norm(embs64, axis=1) * np.linalg.norm(q) + 1e-10)
+        results.append([int(i) for i in np.argsort(-sims)[:top_k]])
+    ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return results, ms
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index", default="data/index", help="index root or directory")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="benchmark a random corpus of this many chunks instead")
+    parser.add_argument("--dim", type=int, default=768, help="dimension for --synthetic")
+    parser.add_argument("--rescore", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=4)
+    args = parser.parse_args()
+
+    tmp = tempfile.TemporaryDirectory()
+    if args.synthetic:
+        synthetic_index(tmp.name, args.synthetic, args.dim, n_docs=20)
+        index = load_index(tmp.name)
+    else:
+        index = load_index(args.index)
+
+    rng = np.random.default_rng(1)
+    rows = rng.choice(len(index), size=min(args.queries, len(index)), replace=False)
+    queries = np.asarray(index.embeddings[rows], dtype=np.float32)
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    embs64 = np.array(index.embeddings, dtype=np.float64)
+    truth, f64_ms = float64_search(embs64, queries, args.top_k)
+    print(f"{len(index)} chunks, {index.dim} dims, {len(queries)} queries, top_k={args.top_k}")
+    print(f"\n{'storage':>8} {'rescore':>8} {'recall@k':>9} {'ms/query':>9} {'scan MB':>8}")
+    print(f"{'float64':>8} {'-':>8} {1.0:>9.3f} {f64_ms:>9.3f} {embs64.nbytes / 2**20:>8.1f}")
+
+    engine = RetrievalEngine(index)
+    found, ms = time_queries(engine, queries, args.top_k, None)
+    print(f"{'float32':>8} {'-':>8} {recall(truth, found, args.top_k):>9.3f} "
+          f"{ms:>9.3f} {index.embeddings.nbytes / 2**20:>8.1f}")
+
+    chunks = [index.chunk(i) for i in range(len(index))]
+    for kind in ("float16", "int8"):
+        arrays = quantize_embeddings(np.asarray(index.embeddings), kind)
+        out_dir = os.path.join(tmp.name, kind)
+        write_index(out_dir, chunks, index.embeddings, model=index.meta.get("model", ""), arrays=arrays)
+        qindex = load_index(out_dir)
+        scan_mb = sum(a.nbytes for a in arrays.values()) / 2**20
+        for rescore in args.rescore:
+            found, ms = time_queries(RetrievalEngine(qindex, rescore=rescore), queries, args.top_k, None)
+            print(f"{kind:>8} {rescore:>8} {recall(truth, found, args.top_k):>9.3f} "
+                  f"{ms:>9.3f} {scan_mb:>8.1f}")
@@ -0,0 +1,443 @@
+"""
+Benchmark suite for the backend, run against a local fake Ollama server
+(fake_ollama.py), so no GPU or model download is needed.
+
+Measures:
+    startup    time to load an index generation (fresh process) and for the
+               API server to report ready (/readyz)
+    retrieval  RetrievalEngine.search / lexical_search and retrieve_chunks
+               queries per second, for synthetic corpora of each --sizes
+    chat       end-to-end /chat and /chat/stream latency (p50/p95/p99, time
+               to first byte) under --clients concurrent clients
+    build      build_index.py chunks per second over docs_raw, and the batch
+               embedder alone over synthetic chunks
+
+Results are written as JSON (default: bench_results/<time>-<commit>.json);
+--compare prints every metric next to an earlier result file.
+
+Usage (from the backend folder):
+    python bench_suite.py
+    python bench_suite.py --only retrieval --sizes 1000 100000 1000000
+    python bench_suite.py --only chat --clients 32 --requests 400 --token-latency 0.02
+    python bench_suite.py --compare bench_results/<earlier>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from fake_ollama import FakeOllamaConfig, start_fake_ollama
+from index_store import publish_index
+from lexical import build_bm25
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Vocabulary for synthetic chunk texts: some HR terms plus filler words
+_HR_WORDS = (
+    "leave annual sick maternity paternity employment act salary overtime "
+    "probation notice termination grievance policy benefits medical claim "
+    "form ir8a cpf contract resignation appraisal bonus allowance"
+).split()
+
+
+def synthetic_corpus(root: str, n: int, dim: int, n_docs: int = 20, seed: int = 0) -> str:
+    """
+    Publish a random corpus of n chunks (with BM25 postings) under root.
+
+    Returns:
+        root, for convenience.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = np.array(_HR_WORDS + [f"w{i}" for i in range(5000)])
+    words = vocab[rng.integers(len(vocab), size=(n, 40))]
+    per_doc = -(-n // n_docs)
+    chunks = [
+        {
+            "id": f"doc{i // per_doc}-chunk-{i}",
+            "doc_id": f"doc{i // per_doc}",
+            "text": " ".join(words[i]),
+        }
+        for i in range(n)
+    ]
+    embs = rng.standard_normal((n, dim), dtype=np.float32)
+    embs /= np.linalg.norm(embs, axis=1, keepdims=True)
+    publish_index(root, chunks, embs, model="fake", arrays=build_bm25(c["text"] for c in chunks))
+    return root
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """p50/p95/p99/mean/max of latencies given in seconds, as milliseconds."""
+    if not values:
+        return {}
+    ms = np.asarray(values) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "mean_ms": float(ms.mean()),
+        "max_ms": float(ms.max()),
+    }
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# ---- startup ----
+
+def bench_startup(corpora: Dict[int, str]) -> dict:
+    """Seconds to import the search code and load each corpus, in a new process."""
+    code = (
+        "import sys, time; t = time.perf_counter()\n"
+        "from index_manager import IndexSnapshot\n"
+        "IndexSnapshot.load(sys.argv[1])\n"
+        "print(time.perf_counter() - t)\n"
+    )
+    out = {}
+    for n, root in corpora.items():
+        proc = subprocess.run(
+            [sys.executable, "-c", code, root],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        )
+        out[str(n)] = {"load_index_s": float(proc.stdout.strip().splitlines()[-1])}
+        print(f"  startup  {n:>9} chunks: {out[str(n)]['load_index_s']:.3f}s")
+    return out
+
+
+# ---- retrieval ----
+
+async def _retrieve_qps(snapshots, queries: List[str], concurrency: int) -> Dict[int, dict]:
+    """
+    retrieve_chunks queries per second for every snapshot and retrieval mode,
+    with the query embeddings already cached (one event loop for all, since
+    the pooled Ollama client is bound to it).
+    """
+    import main
+    import settings
+
+    for q in queries:
+        await main.get_query_embedding(q)
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(snapshot, q):
+        async with sem:
+            await main.retrieve_chunks(q, top_k=4, snapshot=snapshot)
+
+    out = {}
+    mode = settings.RETRIEVAL_MODE
+    try:
+        for n, snapshot in snapshots.items():
+            out[n] = {}
+            for m in ("dense", "hybrid", "lexical"):
+                settings.RETRIEVAL_MODE = m
+                start = time.perf_counter()
+                await asyncio.gather(*(one(snapshot, q) for q in queries))
+                out[n][f"retrieve_{m}_qps"] = len(queries) / (time.perf_counter() - start)
+    finally:
+        settings.RETRIEVAL_MODE = mode
+    return out
+
+
+def bench_retrieval(corpora: Dict[int, str], n_queries: int, concurrency: int) -> dict:
+    from index_manager import IndexSnapshot
+
+    rng = np.random.default_rng(1)
+    queries = [
+        " ".join(rng.choice(_HR_WORDS, size=4)) + f" q{i}" for i in range(n_queries)
+    ]
+    out, snapshots = {}, {}
+    for n, root in corpora.items():
+        snapshot = snapshots[n] = IndexSnapshot.load(root)
+        engine = snapshot.engine
+        embs = rng.standard_normal((n_queries, snapshot.index.dim), dtype=np.float32)
+        res = out[str(n)] = {}
+
+        start = time.perf_counter()
+        for q in embs:
+            engine.search(q, top_k=4)
+        res["search_qps"] = n_queries / (time.perf_counter() - start)
+
+        doc = snapshot.index.doc_ids[0]
+        start = time.perf_counter()
+        for q in embs:
+            engine.search(q, top_k=4, doc_ids=[doc])
+        res["search_one_doc_qps"] = n_queries / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for q in queries:
+            engine.lexical_search(q, top_k=4)
+        res["lexical_qps"] = n_queries / (time.perf_counter() - start)
+
+    for n, res in asyncio.run(_retrieve_qps(snapshots, queries, concurrency)).items():
+        out[str(n)].update(res)
+
+    for n in corpora:
+        res = out[str(n)]
+        print(
+            f"  retrieval {n:>8} chunks: search {res['search_qps']:.0f} q/s, "
+            f"lexical {res['lexical_qps']:.0f} q/s, retrieve_chunks "
+            f"dense/hybrid/lexical {res['retrieve_dense_qps']:.0f}/"
+            f"{res['retrieve_hybrid_qps']:.0f}/{res['retrieve_lexical_qps']:.0f} q/s"
+        )
+    return out
+
+
+# ---- chat ----
+
+async def _chat_load(url: str, path: str, n_requests: int, clients: int) -> dict:
+    import httpx
+
+    latencies, first_bytes, statuses = [], [], {}
+    sem = asyncio.Semaphore(clients)
+
+    async def one(client, i):
+        async with sem:
+            # Unique per request and endpoint, so the answer cache never hits
+            body = {"message": f"How many days of annual leave do I get? ({path} #{i})"}
+            start = time.perf_counter()
+            async with client.stream("POST", url + path, json=body) as r:
+                first = None
+                async for _ in r.aiter_raw():
+                    if first is None:
+                        first = time.perf_counter() - start
+            elapsed = time.perf_counter() - start
+            statuses[str(r.status_code)] = statuses.get(str(r.status_code), 0) + 1
+            if r.status_code == 200:
+                latencies.append(elapsed)
+                first_bytes.append(first or elapsed)
+
+    limits = httpx.Limits(max_connections=clients)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(n_requests)))
+        wall = time.perf_counter() - start
+
+    out = {"requests": n_requests, "clients": clients, "status": statuses,
+           "throughput_rps": n_requests / wall}
+    out.update(percentiles(latencies))
+    out["first_byte"] = percentiles(first_bytes)
+    return out
+
+
+def bench_chat(root: str, fake_url: str, args) -> dict:
+    import httpx
+
+    port = args.port
+    env = dict(
+        os.environ,
+        OLLAMA_URL=fake_url,
+        INDEX_DIR=root,
+        INDEX_WATCH_INTERVAL="0",
+        CHAT_MAX_CONCURRENT=str(args.chat_concurrency),
+        CHAT_MAX_WAITING=str(
+            args.chat_waiting if args.chat_waiting is not None else max(args.clients, 16)
+        ),
+    )
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        # Server startup: time until it is ready (index loaded, models warm)
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                if httpx.get(url + "/readyz", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.05)
+        out = {"server_startup_s": time.perf_counter() - start}
+
+        for path in ("/chat", "/chat/stream"):
+            res = asyncio.run(_chat_load(url, path, args.requests, args.clients))
+            out[path] = res
+            print(
+                f"  chat {path:<13} p50 {res.get('p50_ms', 0):.0f} ms, "
+                f"p95 {res.get('p95_ms', 0):.0f} ms, p99 {res.get('p99_ms', 0):.0f} ms, "
+                f"first byte p50 {res['first_byte'].get('p50_ms', 0):.0f} ms, "
+                f"status {res['status']}"
+            )
+        return out
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# ---- build ----
+
+def bench_build(fake_url: str, n_chunks: int) -> dict:
+    out = {}
+
+    # Whole build_index.py run over a copy of docs_raw
+    work = tempfile.mkdtemp(prefix="bench-build-")
+    try:
+        shutil.copytree(os.path.join(BACKEND_DIR, "docs_raw"), os.path.join(work, "docs_raw"))
+        env = dict(os.environ, OLLAMA_URL=fake_url,
+                   PYTHONPATH=BACKEND_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, os.path.join(BACKEND_DIR, "build_index.py"), "--full"],
+            cwd=work, env=env, capture_output=True, text=True,
+        )
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            raise RuntimeError(f"build_index.py failed:\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+        from index_store import load_index
+        count = len(load_index(os.path.join(work, "data", "index")))
+        out["build_index"] = {
+            "chunks": count, "seconds": elapsed, "chunks_per_s": count / elapsed,
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    # Batch embedder alone, on synthetic chunks
+    import build_index
+    texts = [f"synthetic chunk {i} " * 60 for i in range(n_chunks)]
+    embedder = build_index.BatchEmbedder()
+    start = time.perf_counter()
+    for t in texts:
+        embedder.add(t)
+    embedder.finish()
+    elapsed = time.perf_counter() - start
+    out["embedder"] = {"chunks": n_chunks, "seconds": elapsed, "chunks_per_s": n_chunks / elapsed}
+
+    print(
+        f"  build    build_index.py {out['build_index']['chunks_per_s']:.1f} chunks/s, "
+        f"embedder {out['embedder']['chunks_per_s']:.1f} chunks/s"
+    )
+    return out
+
+
+# ---- comparing runs ----
+
+def flatten(obj, prefix: str = "") -> Dict[str, float]:
+    """{"a": {"b": 1}} -> {"a.b": 1}, numbers only."""
+    out = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+
+def compare(old: dict, new: dict) -> None:
+    """Print every metric of two result files side by side."""
+    a, b = flatten(old["results"]), flatten(new["results"])
+    print(f"\n{'metric':<60} {old['meta']['commit']:>12} {new['meta']['commit']:>12} {'change':>8}")
+    for key in sorted(set(a) & set(b)):
+        change = (b[key] - a[key]) / a[key] * 100 if a[key] else 0.0
+        print(f"{key:<60} {a[key]:>12.3f} {b[key]:>12.3f} {change:>+7.1f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend benchmark suite (fake Ollama).")
+    parser.add_argument("--only", nargs="+", choices=["startup", "retrieval", "chat", "build"],
+                        default=["startup", "retrieval", "chat", "build"])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10_000, 100_000],
+                        help="synthetic corpus sizes in chunks (up to 1000000; "
+                             "1M x 768 dims needs ~10 GB of RAM to build)")
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="concurrent retrieve_chunks calls")
+    parser.add_argument("--chat-size", type=int, default=10_000,
+                        help="corpus size for the /chat benchmark")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent /chat clients")
+    parser.add_argument("--requests", type=int, default=200, help="/chat requests per endpoint")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--chat-concurrency", type=int, default=4,
+                        help="CHAT_MAX_CONCURRENT for the API server")
+    parser.add_argument("--chat-waiting", type=int, default=None,
+                        help="CHAT_MAX_WAITING for the API server (default: enough "
+                             "for every client; set it lower to test 429s)")
+    parser.add_argument("--port", type=int, default=8765, help="port for the API server")
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--first-token-latency", type=float, default=0.05)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--build-chunks", type=int, default=2000,
+                        help="synthetic chunks for the embedder benchmark")
+    parser.add_argument("--out", default=None, help="result file (default: bench_results/...)")
+    parser.add_argument("--compare", default=None, help="earlier result file to compare with")
+    args = parser.parse_args()
+
+    fake = start_fake_ollama(FakeOllamaConfig(
+        dim=args.dim,
+        embed_latency=args.embed_latency,
+        first_token_latency=args.first_token_latency,
+        token_latency=args.token_latency,
+        reply_tokens=args.reply_tokens,
+    ))
+    work = tempfile.mkdtemp(prefix="bench-")
+    try:
+        sizes = sorted(set(args.sizes) | ({args.chat_size} if "chat" in args.only else set()))
+        corpora = {}
+        for n in sizes:
+            t0 = time.perf_counter()
+            corpora[n] = synthetic_corpus(os.path.join(work, str(n)), n, args.dim)
+            print(f"🧪 Built synthetic corpus of {n} chunks in {time.perf_counter() - t0:.1f}s")
+
+        # main.py reads these at import time
+        os.environ["OLLAMA_URL"] = fake.url
+        os.environ["INDEX_DIR"] = corpora[sizes[0]]
+
+        results = {}
+        bench_sizes = {n: corpora[n] for n in args.sizes}
+        if "startup" in args.only:
+            results["startup"] = bench_startup(bench_sizes)
+        if "retrieval" in args.only:
+            results["retrieval"] = bench_retrieval(bench_sizes, args.queries, args.concurrency)
+        if "chat" in args.only:
+            results["chat"] = bench_chat(corpora[args.chat_size], fake.url, args)
+        if "build" in args.only:
+            results["build"] = bench_build(fake.url, args.build_chunks)
+    finally:
+        fake.shutdown()
+        shutil.rmtree(work, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    out_path = args.out or os.path.join(
+        BACKEND_DIR, "bench_results", f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    )
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n📄 Results written to {out_path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), report)
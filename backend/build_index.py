@@ -1,48 +1,130 @@
+import argparse
+import hashlib
 import os
-import json
-import pdfplumber
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
 import requests
+import requests.adapters
+
+import settings
+from ann import CENTROIDS, default_n_lists, train_ivf
+from index_store import load_index, normalize_rows, publish_index, read_manifest
+from lexical import build_bm25
+from pdf_extract import BACKENDS, PAGES_PER_TASK, extract_pdfs
+from quantize import KINDS, quantize_embeddings
 
 # Base URL for your local Ollama server
-OLLAMA_URL = "http://localhost:11434"
+OLLAMA_URL = settings.OLLAMA_URL
 
 # Name of the embedding model used to embed chunks
-EMBED_MODEL = "nomic-embed-text"
+EMBED_MODEL = settings.EMBED_MODEL
+
+# Chunking settings (stored in the manifest, with the --extractor backend:
+# changing them re-chunks all PDFs)
+CHUNK_SIZE = 1200
+CHUNK_OVERLAP = 200
 
+# Version of the manifest layout. Bump it whenever the manifest starts
+# recording another input that decides a file's chunks, so manifests
+# written without it are not trusted (2: added "extractor")
+MANIFEST_VERSION = 2
 
-def get_embedding(text: str):
+
+def embed_batch(session: requests.Session, texts: List[str], retries: int = 4) -> List[List[float]]:
     """
-    Call Ollama's embedding endpoint to get an embedding for a text chunk.
+    Embed many chunks in one call to Ollama's batch /api/embed endpoint.
 
     Args:
-        text: The text content of one chunk.
+        session: Pooled HTTP session shared by all batches.
+        texts: The chunk texts to embed.
+        retries: How many times to retry a failed call (with exponential
+                 backoff) before giving up.
 
     Returns:
-        A Python list of floats representing the embedding vector.
+        One embedding (list of floats) per input text, in the same order.
     """
-    # Log the first part of the chunk to see what we're embedding (for debugging)
-    print("  ▶ Embedding chunk snippet:", repr(text[:80]))
-
-    # Send the text to Ollama's /api/embeddings endpoint
-    r = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text},
-        timeout=60,
-    )
-
-    # Log HTTP status code for visibility
-    print("  ◀ Embedding status:", r.status_code)
-
-    # If there was an error response, print the body for debugging
-    if not r.ok:
-        print("  ❌ Embedding error body:", r.text[:300])
+    for attempt in range(retries + 1):
+        try:
+            r = session.post(
+                f"{OLLAMA_URL}/api/embed",
+                json={"model": EMBED_MODEL, "input": texts},
+                timeout=300,
+            )
+            # Only overload / server errors are worth retrying
+            if r.status_code == 429 or r.status_code >= 500:
+                r.raise_for_status()
+            if not r.ok:
+                print("  ❌ Embedding error body:", r.text[:300])
+                r.raise_for_status()
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            status = getattr(e.response, "status_code", None)
+            retryable = status is None or status == 429 or status >= 500
+            if attempt == retries or not retryable:
+                raise
+            delay = 0.5 * 2 ** attempt
+            print(f"  ⚠ Embedding batch failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    embeddings = r.json()["embeddings"]
+    if len(embeddings) != len(texts):
+        raise ValueError(f"asked for {len(texts)} embeddings, got {len(embeddings)}")
+    return embeddings
+
+
+class BatchEmbedder:
+    """
+    Embeds chunks in batches on a small thread pool while the caller keeps
+    extracting and chunking PDFs.
 
-    # Raise an exception if the request failed (4xx/5xx)
-    r.raise_for_status()
+    Args:
+        batch_size: Chunks sent per /api/embed call.
+        max_in_flight: Batches allowed to be in flight at once. add() blocks
+                       when this many are pending, so memory stays bounded.
+        retries: Retries per batch (see embed_batch).
+    """
 
-    # Parse the JSON and return just the "embedding" list
-    data = r.json()
-    return data["embedding"]
+    def __init__(self, batch_size: int = 32, max_in_flight: int = 4, retries: int = 4):
+        self.batch_size = batch_size
+        self.retries = retries
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max_in_flight)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._pending: List[str] = []
+        self._futures: List[Future] = []
+
+    def add(self, text: str) -> None:
+        """Queue one chunk; a full batch is sent off straight away."""
+        self._pending.append(text)
+        if len(self._pending) >= self.batch_size:
+            self._submit()
+
+    def _submit(self) -> None:
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        self._slots.acquire()
+        fut = self._pool.submit(embed_batch, self.session, batch, self.retries)
+        fut.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(fut)
+
+    def finish(self) -> List[List[float]]:
+        """Send the last partial batch and return all embeddings in add() order."""
+        self._submit()
+        try:
+            embeddings = []
+            for fut in self._futures:
+                embeddings.extend(fut.result())
+            return embeddings
+        finally:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self.session.close()
 
 
 def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200):
@@ -74,43 +156,181 @@ def chunk_text(text: str, chunk_size: int = 1200, overlap: int = 200):
             yield chunk
 
 
-def pdf_to_text(path: str) -> str:
+def chunk_pages(
+    pages: Iterable[Tuple[int, str]], chunk_size: int = 1200, overlap: int = 200
+) -> Iterator[Tuple[str, int, int]]:
     """
-    Extract text from a PDF file using pdfplumber.
+    Streaming chunk_text() over the pages of a document.
+
+    Gives exactly the chunks chunk_text() gives for the non-empty page texts
+    joined with newlines, so chunks (and their reused embeddings) do not
+    depend on page breaks, but only keeps about one chunk of text in memory.
 
     Args:
-        path: Path to the PDF file on disk.
+        pages: (page number, text) pairs, in order.
+        chunk_size, overlap: As for chunk_text().
+
+    Yields:
+        (chunk, first page, last page) for every chunk.
+    """
+    assert chunk_size > overlap, "chunk_size must be larger than overlap"
+    step = chunk_size - overlap
+
+    buf = ""     # text from offset `base` on
+    base = 0
+    n = 0        # length of the joined text so far
+    start = 0    # offset of the next chunk
+    marks = []   # (offset, page number) of the pages still in buf
+
+    def page_at(pos: int) -> int:
+        page = marks[0][1]
+        for offset, p in marks:
+            if offset > pos:
+                break
+            page = p
+        return page
+
+    def emit():
+        end = min(start + chunk_size, n)
+        chunk = buf[start - base:end - base]
+        return chunk, page_at(start), page_at(end - 1)
+
+    for page_no, text in pages:
+        if not text:
+            continue
+        if n:
+            buf += "\n"
+            n += 1
+        marks.append((n, page_no))
+        buf += text
+        n += len(text)
+
+        # Chunks that cannot grow any more
+        while start + chunk_size <= n:
+            chunk, first, last = emit()
+            if chunk.strip():
+                yield chunk, first, last
+            start += step
+            buf, base = buf[start - base:], start
+            while len(marks) > 1 and marks[1][0] <= start:
+                marks.pop(0)
+
+    while start < n:
+        chunk, first, last = emit()
+        if chunk.strip():
+            yield chunk, first, last
+        start += step
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a source file, used to spot new / changed PDFs."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_sha256(text: str) -> str:
+    """Content hash of one chunk, used to reuse embeddings of unchanged text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_previous(index_root: str):
+    """
+    Load the live index generation and its manifest, if there is one.
 
     Returns:
-        A single string containing all page texts joined with newlines.
+        (index, manifest); either can be None.
     """
-    print(f"📄 Extracting text from: {path}")
-    with pdfplumber.open(path) as pdf:
-        out = []
-        for i, page in enumerate(pdf.pages):
-            # Extract text from each page (may be None if it's image-only)
-            t = page.extract_text()
-            print(f"  Page {i+1}: {'has text' if t else 'NO text'}")
-            if t:
-                out.append(t)
-        # Join all pages into one big string
-        return "\n".join(out)
+    try:
+        index = load_index(index_root)
+    except (FileNotFoundError, ValueError):
+        return None, None
+    return index, read_manifest(index.path)
 
 
 if __name__ == "__main__":
-    # Folder where your source PDFs live
+    parser = argparse.ArgumentParser(description="Build the chunk index from docs_raw PDFs.")
+    parser.add_argument("--batch-size", type=int, default=32,
+                        help="chunks per /api/embed call (default: 32)")
+    parser.add_argument("--in-flight", type=int, default=4,
+                        help="embedding batches in flight at once (default: 4)")
+    parser.add_argument("--retries", type=int, default=4,
+                        help="retries per failed batch (default: 4)")
+    parser.add_argument("--ivf-lists", type=int, default=None,
+                        help="IVF lists for approximate search (default: about "
+                             "sqrt(chunks) above 5000 chunks, 0 = no IVF index)")
+    parser.add_argument("--quantize", choices=KINDS, default="none",
+                        help="also store a float16 or int8 copy of the embeddings "
+                             "for faster, smaller scans (default: none)")
+    parser.add_argument("--no-bm25", action="store_true",
+                        help="skip the BM25 index (dense retrieval only)")
+    parser.add_argument("--extractor", choices=BACKENDS, default="auto",
+                        help="PDF text backend (default: auto = pypdfium2, "
+                             "falling back to pdfplumber)")
+    parser.add_argument("--extract-workers", type=int, default=None,
+                        help="PDF extraction processes (default: one per CPU, "
+                             "0 = extract in this process)")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK,
+                        help=f"pages per extraction task (default: {PAGES_PER_TASK})")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the previous index and re-embed everything")
+    args = parser.parse_args()
+
+    # Folder where your source PDFs live, and where the index goes
     docs_dir = "docs_raw"
-
-    # This will hold all chunks from all PDFs
-    all_chunks = []
+    out_path = "data/index"
 
     print(f"🔍 Scanning folder: {docs_dir}")
     if not os.path.isdir(docs_dir):
         print("❌ docs_raw directory not found!")
         raise SystemExit(1)
 
-    # Loop through every file in docs_raw
-    for fname in os.listdir(docs_dir):
+    # 0) Look at the previous build: unchanged PDFs keep their chunks, and
+    #    any chunk whose text we have embedded before keeps its embedding
+    prev, prev_manifest = (None, None) if args.full else load_previous(out_path)
+    if prev is not None and prev.meta.get("model") != EMBED_MODEL:
+        print("⚠ Previous index used a different embedding model, re-embedding everything.")
+        prev, prev_manifest = None, None
+
+    prev_files = {}
+    prev_hashes = []
+    prev_rows_by_doc = {}
+    if prev is not None:
+        same_chunking = prev_manifest is not None and (
+            prev_manifest.get("version") == MANIFEST_VERSION
+            and prev_manifest.get("chunk_size") == CHUNK_SIZE
+            and prev_manifest.get("chunk_overlap") == CHUNK_OVERLAP
+            and prev_manifest.get("extractor") == args.extractor
+        )
+        if same_chunking:
+            prev_files = prev_manifest["files"]
+            prev_hashes = prev_manifest["chunk_hashes"]
+        else:
+            # Re-extract every PDF; chunks with the same text as before
+            # still keep their embeddings
+            if prev_manifest is not None:
+                print("⚠ Chunking settings, PDF extractor or manifest version changed, "
+                      "re-chunking all PDFs.")
+            prev_hashes = [text_sha256(prev.text(i)) for i in range(len(prev))]
+        for i, d in enumerate(prev.doc_ids):
+            prev_rows_by_doc.setdefault(d, []).append(i)
+    prev_row_by_hash = {h: i for i, h in enumerate(prev_hashes)}
+
+    # This will hold all chunks from all PDFs; embeddings for new chunks are
+    # computed in the background while we keep extracting the next PDFs
+    all_chunks = []
+    chunk_hashes = []
+    all_embeddings = []        # reused vector, or None until embedded
+    new_positions = []         # rows waiting for the embedder, in order
+    files = {}
+    embedder = BatchEmbedder(args.batch_size, args.in_flight, args.retries)
+    started = time.perf_counter()
+
+    # Decide per PDF: reuse its chunks from the previous index, or extract it
+    plan = []
+    for fname in sorted(os.listdir(docs_dir)):
         # Only process PDFs
         if not fname.lower().endswith(".pdf"):
             continue
@@ -119,31 +339,130 @@ if __name__ == "__main__":
         # Use the filename (without extension) as the doc_id
         # e.g. "29_common_hr_policies_aihr"
         doc_id = os.path.splitext(fname)[0]
-        print(f"\n=== Processing {pdf_path} as doc_id={doc_id} ===")
-
-        # 1) Extract text from the PDF
-        text = pdf_to_text(pdf_path)
-        if not text.strip():
-            print("⚠ No text extracted from this PDF, skipping.")
-            continue
+        file_hash = file_sha256(pdf_path)
+        files[fname] = {"sha256": file_hash, "doc_id": doc_id}
+
+        old = prev_files.get(fname)
+        unchanged = old and old["sha256"] == file_hash and doc_id in prev_rows_by_doc
+        plan.append((pdf_path, doc_id, unchanged))
+
+    # Pages of the PDFs to extract, from a process pool (see pdf_extract.py),
+    # in order and only a few page ranges ahead of the loop below
+    extracted = extract_pdfs(
+        [path for path, _, unchanged in plan if not unchanged],
+        workers=args.extract_workers,
+        pages_per_task=args.pages_per_task,
+        backend=args.extractor,
+    )
+    try:
+        for pdf_path, doc_id, unchanged in plan:
+            # Unchanged PDF: take its chunks and embeddings from the previous index
+            if unchanged:
+                rows = prev_rows_by_doc[doc_id]
+                for i in rows:
+                    all_chunks.append(prev.chunk(i))
+                    chunk_hashes.append(prev_hashes[i])
+                    all_embeddings.append(prev.embeddings[i])
+                print(f"♻ Unchanged: {pdf_path} ({len(rows)} chunks reused)")
+                continue
+
+            print(f"\n=== Processing {pdf_path} as doc_id={doc_id} ===")
+            _, pages = next(extracted)
+            page_stats = {"pages": 0, "empty": 0}
+
+            def counted(pages):
+                for page_no, text in pages:
+                    page_stats["pages"] += 1
+                    page_stats["empty"] += not text.strip()
+                    yield page_no, text
+
+            # 1-2) Chunk the pages as they are extracted, and queue each new
+            #      chunk for embedding
+            n_before, n_new = len(all_chunks), len(new_positions)
+            chunks = chunk_pages(counted(pages), CHUNK_SIZE, CHUNK_OVERLAP)
+            for idx, (chunk, first_page, last_page) in enumerate(chunks):
+                h = text_sha256(chunk)
+                # Store everything needed for RAG later
+                all_chunks.append({
+                    "id": f"{doc_id}-chunk-{idx}",  # unique chunk id
+                    "doc_id": doc_id,               # which PDF this chunk came from
+                    "text": chunk,                  # raw chunk text
+                    "pages": [first_page, last_page],
+                })
+                chunk_hashes.append(h)
+
+                row = prev_row_by_hash.get(h)
+                if row is not None:
+                    all_embeddings.append(prev.embeddings[row])
+                else:
+                    all_embeddings.append(None)
+                    new_positions.append(len(all_embeddings) - 1)
+                    embedder.add(chunk)             # embedding, same row order
+
+            print(f"  📄 {page_stats['pages']} pages, {page_stats['empty']} without text")
+            if len(all_chunks) == n_before:
+                print("⚠ No text extracted from this PDF, skipping.")
+                continue
+            n_queued = len(new_positions) - n_new
+            print(
+                f"  📌 {len(all_chunks) - n_before} chunks, "
+                f"{n_queued} queued for embedding"
+            )
+    finally:
+        extracted.close()
+
+    for fname in sorted(set(prev_files) - set(files)):
+        print(f"🗑 Removed: {fname} (its chunks are dropped)")
+
+    # 3) Wait for the remaining embedding batches
+    for pos, emb in zip(new_positions, embedder.finish()):
+        all_embeddings[pos] = emb
+    elapsed = time.perf_counter() - started
+
+    # 4) Train the IVF index for approximate search (see ann.py), on the same
+    #    unit-length rows the index stores
+    arrays = {}
+    embs = normalize_rows(all_embeddings) if all_chunks else None
+    n_lists = args.ivf_lists if args.ivf_lists is not None else default_n_lists(len(all_chunks))
+    if n_lists > 0 and all_chunks:
+        t0 = time.perf_counter()
+        arrays = train_ivf(embs, n_lists)
+        print(
+            f"🧭 Trained IVF index: {len(arrays[CENTROIDS])} lists "
+            f"in {time.perf_counter() - t0:.1f}s"
+        )
+
+    # 5) Quantized copy of the embeddings for the search scan (see quantize.py)
+    if all_chunks:
+        arrays.update(quantize_embeddings(embs, args.quantize))
+
+    # 6) BM25 inverted index over the chunk texts (see lexical.py)
+    if all_chunks and not args.no_bm25:
+        arrays.update(build_bm25(c["text"] for c in all_chunks))
+
+    # 7) Publish chunks + embeddings as a new index generation (see
+    #    index_store.py); a running server picks it up on reload
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "extractor": args.extractor,
+        "files": files,
+        "chunk_hashes": chunk_hashes,
+    }
+    index_id = publish_index(
+        out_path,
+        all_chunks,
+        embs if embs is not None else all_embeddings,
+        model=EMBED_MODEL,
+        manifest=manifest,
+        arrays=arrays,
+    )
 
-        # 2) Chunk the text and embed each chunk
-        for idx, chunk in enumerate(chunk_text(text)):
-            print(f"  📌 Chunk {idx}")
-            emb = get_embedding(chunk)
-
-            # Store everything needed for RAG later
-            all_chunks.append({
-                "id": f"{doc_id}-chunk-{idx}",  # unique chunk id
-                "doc_id": doc_id,               # which PDF this chunk came from
-                "text": chunk,                  # raw chunk text
-                "embedding": emb,               # embedding vector
-            })
-
-    # 3) Save all chunks + embeddings into a single JSON index
-    os.makedirs("data", exist_ok=True)
-    out_path = "data/chunks.json"
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(all_chunks, f)
-
-    print(f"\n✅ Indexed {len(all_chunks)} chunks into {out_path}")
+    n_embedded = len(new_positions)
+    rate = n_embedded / elapsed if elapsed > 0 else 0.0
+    print(f"\n✅ Indexed {len(all_chunks)} chunks into {out_path} (generation {index_id})")
+    print(
+        f"⏱ {elapsed:.1f}s total, {n_embedded} chunks embedded at {rate:.1f} chunks/s "
+        f"(batch size {args.batch_size}, {args.in_flight} batches in flight)"
+    )
@@ -0,0 +1,281 @@
+"""
+In-process caches for the chat path.
+
+LRUCache is a small LRU + TTL cache with an approximate memory cap and
+hit/miss counters. Its get_or_compute() also de-duplicates concurrent misses
+("single flight"): N identical requests arriving together run the expensive
+call once and all share the result. stream() does the same for streamed
+values: every identical request reads the same stream (see SharedStream).
+"""
+import asyncio
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+_MISSING = object()
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a user message: lower-cased, whitespace collapsed."""
+    return " ".join(text.lower().split())
+
+
+def approx_sizeof(value: Any) -> int:
+    """Rough size in bytes of a cached value (numpy arrays, str, others)."""
+    nbytes = getattr(value, "nbytes", None)
+    if nbytes is not None:
+        return int(nbytes)
+    return sys.getsizeof(value)
+
+
+class SharedStream:
+    """
+    One async stream of pieces, read by any number of readers.
+
+    The source runs as its own task. Every reader gets all pieces from the
+    start, including those produced before it joined. When the last reader
+    goes away before the end, the source is cancelled (and closed).
+
+    Args:
+        source: The stream to share, e.g. an LLM reply generator.
+    """
+
+    def __init__(self, source: AsyncIterator[Any]):
+        self.pieces: List[Any] = []
+        self.done = False
+        self.closed = False       # cancelled: no new readers
+        self.error: Optional[BaseException] = None
+        self.readers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncIterator[Any]) -> None:
+        try:
+            async for piece in source:
+                self.pieces.append(piece)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            aclose = getattr(source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    def _notify(self) -> None:
+        # Wakes everyone waiting now; later waits block until the next change
+        self._changed.set()
+        self._changed.clear()
+
+    async def read(self) -> AsyncIterator[Any]:
+        """Yield every piece from the start; re-raises the source's error."""
+        self.readers += 1
+        try:
+            i = 0
+            while True:
+                while i < len(self.pieces):
+                    yield self.pieces[i]
+                    i += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.readers -= 1
+            if self.readers == 0 and not self.done:
+                self.closed = True
+                self.task.cancel()
+
+
+class LRUCache:
+    """
+    Bounded LRU cache with a per-entry TTL.
+
+    Args:
+        name: Shown in stats().
+        max_entries: Maximum number of entries kept.
+        max_bytes: Approximate memory cap for all values together.
+        ttl: Seconds an entry stays valid (0 = no expiry).
+        sizeof: Function returning the size in bytes of one value.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float,
+        sizeof: Callable[[Any], int] = approx_sizeof,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+
+        # key -> (expires_at, size, value), least recently used first
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, SharedStream] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0      # misses that joined an in-flight computation
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _drop(self, key: Hashable) -> None:
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value (and count a hit), or default on a miss."""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, _, value = entry
+            if not self.ttl or expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self._drop(key)
+        self.misses += 1
+        return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting least recently used entries to fit."""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+
+        self._data[key] = (time.monotonic() + self.ttl, size, value)
+        self._bytes += size
+
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._data.clear()
+        self._bytes = 0
+
+    async def get_or_compute(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        should_cache: Callable[[Any], bool] = lambda value: True,
+        on_result: Optional[Callable[[str], None]] = None,
+    ) -> Any:
+        """
+        Return the cached value for key, computing it on a miss.
+
+        Concurrent misses for the same key share one call to compute(). The
+        call runs as its own task, so it still finishes (and fills the cache)
+        if the request that started it goes away.
+
+        Args:
+            key: Cache key.
+            compute: Zero-argument coroutine function producing the value.
+            should_cache: Return False to hand a value back without caching
+                it (e.g. error replies).
+            on_result: Called with "hit", "miss" (this call computes) or
+                "shared" (joined an in-flight computation), e.g. for metrics.
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            if on_result is not None:
+                on_result("hit")
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+
+            def _done(t: asyncio.Future) -> None:
+                if self._inflight.get(key) is t:
+                    del self._inflight[key]
+                if t.cancelled():
+                    return
+                if t.exception() is None and should_cache(t.result()):
+                    self.put(key, t.result())
+
+            task.add_done_callback(_done)
+            if on_result is not None:
+                on_result("miss")
+        else:
+            self.shared += 1
+            if on_result is not None:
+                on_result("shared")
+
+        return await asyncio.shield(task)
+
+    def stream(
+        self,
+        key: Hashable,
+        start: Callable[[], AsyncIterator[str]],
+        should_cache: Callable[[List[str]], bool] = lambda pieces: True,
+        on_result: Optional[Callable[[str], None]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Single flight for a streamed value (after a cache miss).
+
+        Concurrent calls for the same key read one stream started with
+        start(). When it completes, the joined pieces are cached.
+
+        Args:
+            key: Cache key.
+            start: Zero-argument function returning the async iterator of
+                   string pieces.
+            should_cache: Return False to not cache the pieces (e.g. an
+                          error reply).
+            on_result: Called with "miss" (this call starts the stream) or
+                       "shared" (joined an in-flight stream).
+
+        Returns:
+            An async iterator over all pieces, from the first one.
+        """
+        shared = self._streams.get(key)
+        if shared is None or shared.closed:
+            shared = SharedStream(start())
+            self._streams[key] = shared
+
+            def _done(t: asyncio.Future) -> None:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+                if shared.closed or shared.error is not None:
+                    return
+                if shared.pieces and should_cache(shared.pieces):
+                    self.put(key, "".join(shared.pieces))
+
+            shared.task.add_done_callback(_done)
+            if on_result is not None:
+                on_result("miss")
+        else:
+            self.shared += 1
+            if on_result is not None:
+                on_result("shared")
+        return shared.read()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared": self.shared,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
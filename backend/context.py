@@ -0,0 +1,146 @@
+"""
+Build the database context sent to the LLM from retrieved chunks.
+
+build_index.chunk_text() cuts documents into overlapping windows, so two
+neighbouring chunks of one doc share CHUNK_OVERLAP characters. Sending both
+verbatim repeats that text in the prompt. assemble_context() stitches
+neighbouring chunks back into one passage, then keeps the passages (best
+ranked first) that fit in a token budget.
+
+Tokens are estimated from the character count; the budget is a cap on
+prefill work, not an exact tokenizer count.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Separator between passages in the context
+SEPARATOR = "\n\n---\n\n"
+
+# Rough characters per token for English text with Llama-style tokenizers
+CHARS_PER_TOKEN = 4.0
+
+# A passage cut to fewer tokens than this is left out instead
+MIN_PASSAGE_TOKENS = 50
+
+_CHUNK_NO = re.compile(r"-chunk-(\d+)$")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate number of LLM tokens in text."""
+    return int(len(text) / CHARS_PER_TOKEN + 0.5)
+
+
+def chunk_number(chunk_id: str) -> Optional[int]:
+    """Position of a chunk in its doc, from ids like "<doc_id>-chunk-7"."""
+    m = _CHUNK_NO.search(chunk_id)
+    return int(m.group(1)) if m else None
+
+
+def overlap_length(a: str, b: str) -> int:
+    """Length of the longest suffix of a that is also a prefix of b."""
+    if not a or not b:
+        return 0
+    # The first match from the left is the longest overlap
+    i = max(0, len(a) - len(b))
+    while True:
+        i = a.find(b[0], i)
+        if i < 0:
+            return 0
+        if b.startswith(a[i:]):
+            return len(a) - i
+        i += 1
+
+
+def merge_chunks(chunks: List[dict]) -> List[str]:
+    """
+    Join neighbouring chunks of the same doc into single passages.
+
+    Args:
+        chunks: Retrieved chunk dicts ("id", "doc_id", "text"), best first.
+
+    Returns:
+        Passage texts, ordered by the best rank among their chunks. Each
+        passage keeps its chunks in document order, with the overlapping
+        text only once.
+    """
+    # Group numbered chunks by doc; chunks without a number stay on their own
+    runs: List[Tuple[int, List[dict]]] = []
+    numbered: Dict[str, List[Tuple[int, int, dict]]] = {}
+    for rank, c in enumerate(chunks):
+        n = chunk_number(c["id"])
+        if n is None:
+            runs.append((rank, [c]))
+        else:
+            numbered.setdefault(c["doc_id"], []).append((n, rank, c))
+
+    for items in numbered.values():
+        items.sort(key=lambda t: t[0])
+        run_rank, run, prev_n = None, [], None
+        for n, rank, c in items:
+            if run and n == prev_n:
+                continue  # same chunk retrieved twice
+            if run and n != prev_n + 1:
+                runs.append((run_rank, run))
+                run_rank, run = None, []
+            run.append(c)
+            run_rank = rank if run_rank is None else min(run_rank, rank)
+            prev_n = n
+        if run:
+            runs.append((run_rank, run))
+
+    runs.sort(key=lambda r: r[0])
+    passages = []
+    for _, run in runs:
+        text = run[0]["text"]
+        for c in run[1:]:
+            k = overlap_length(text, c["text"])
+            # Adjacent chunks without overlap were cut at a whitespace gap
+            text += c["text"][k:] if k else "\n" + c["text"]
+        passages.append(text)
+    return passages
+
+
+def _cut(text: str, max_chars: int) -> str:
+    """Cut text to at most max_chars, at a line or word break if there is one."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    for sep in ("\n", " "):
+        pos = cut.rfind(sep)
+        if pos >= max_chars // 2:
+            return cut[:pos].rstrip()
+    return cut
+
+
+def assemble_context(chunks: List[dict], max_tokens: int = 0) -> str:
+    """
+    Database context for the prompt: merged passages within a token budget.
+
+    Passages are added best first. The first one that does not fit is cut to
+    the remaining budget (or left out if too little is left), and nothing
+    after it is added. The best passage is always included, cut if needed.
+
+    Args:
+        chunks: Retrieved chunk dicts, best first.
+        max_tokens: Token budget for the whole context (0 = no limit).
+
+    Returns:
+        The context text ("" if there are no chunks).
+    """
+    passages = merge_chunks(chunks)
+    if max_tokens <= 0:
+        return SEPARATOR.join(passages)
+
+    kept: List[str] = []
+    budget = max_tokens * CHARS_PER_TOKEN
+    for text in passages:
+        if kept:
+            budget -= len(SEPARATOR)
+        if len(text) <= budget:
+            kept.append(text)
+            budget -= len(text)
+            continue
+        if not kept or budget >= MIN_PASSAGE_TOKENS * CHARS_PER_TOKEN:
+            kept.append(_cut(text, int(max(budget, 0))))
+        break
+    return SEPARATOR.join(kept)
@@ -0,0 +1,49 @@
+"""
+One-off converter from the old JSON index (data/chunks.json) to the binary
+index format in index_store.py.
+
+Usage (from the backend folder):
+    python convert_index.py [data/chunks.json] [data/index]
+"""
+import json
+import sys
+
+from index_store import load_index, publish_index
+from lexical import build_bm25
+
+EMBED_MODEL = "nomic-embed-text"
+
+
+def convert(json_path: str, out_dir: str) -> int:
+    """
+    Read an old chunks.json and write it out as a binary index.
+
+    Args:
+        json_path: Path to the JSON list of {"id", "doc_id", "text", "embedding"}.
+        out_dir: Index root to publish the converted index into.
+
+    Returns:
+        Number of chunks converted.
+    """
+    with open(json_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+
+    publish_index(
+        out_dir,
+        chunks,
+        [c["embedding"] for c in chunks],
+        model=EMBED_MODEL,
+        arrays=build_bm25(c["text"] for c in chunks) if chunks else None,
+    )
+    return len(chunks)
+
+
+if __name__ == "__main__":
+    json_path = sys.argv[1] if len(sys.argv) > 1 else "data/chunks.json"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "data/index"
+
+    n = convert(json_path, out_dir)
+
+    # Read it back once so a broken conversion fails here, not in the server
+    index = load_index(out_dir)
+    print(f"✅ Converted {n} chunks ({index.dim}-dim) from {json_path} into {out_dir}")
@@ -0,0 +1,276 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks and offline runs.
+
+Embeddings are deterministic (seeded from a hash of the text), and chat
+replies are streamed word by word with a configurable delay, so latency
+numbers depend only on our own code and the settings below.
+
+Implements the endpoints the backend uses:
+
+    POST /api/embeddings   {"model", "prompt"}        -> {"embedding"}
+    POST /api/embed        {"model", "input"}         -> {"embeddings"}
+    POST /api/chat         {"model", "messages", "stream"}
+    POST /api/generate     {"model", "prompt", "stream"}
+    GET  /api/tags
+    GET  /api/ps                                      (models used since start
+                                                       or the last evict())
+
+Usage (from the backend folder):
+    python fake_ollama.py --port 11434 --embed-latency 0.02 --token-latency 0.01
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Words of the fake reply, cycled; includes the markup format_llm_reply handles
+_REPLY_WORDS = (
+    "**Summary** Employees are entitled to paid annual leave under the policy. "
+    "* Submit requests through your manager at least two weeks ahead. "
+    "* Unused leave may be carried forward as stated in the handbook. "
+    "Please contact HR if anything is unclear."
+).split(" ")
+
+
+class FakeOllamaConfig:
+    """
+    Behaviour of the fake server.
+
+    Args:
+        dim: Embedding dimension.
+        embed_latency: Seconds per embedding call.
+        embed_item_latency: Extra seconds per input text in a batch call.
+        first_token_latency: Seconds before the first chat token.
+        token_latency: Seconds between chat tokens.
+        reply_tokens: Number of words in every chat reply.
+    """
+
+    def __init__(
+        self,
+        dim: int = 768,
+        embed_latency: float = 0.0,
+        embed_item_latency: float = 0.0,
+        first_token_latency: float = 0.0,
+        token_latency: float = 0.0,
+        reply_tokens: int = 60,
+    ):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.reply_tokens = reply_tokens
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Unit-length vector seeded from the text; equal texts, equal vectors."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    v = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def fake_reply_tokens(n: int) -> List[str]:
+    """The first n words of the fake reply, each with its leading space."""
+    return [
+        (" " if i else "") + _REPLY_WORDS[i % len(_REPLY_WORDS)]
+        for i in range(n)
+    ]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeOllamaServer"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, obj, status: int = 200) -> None:
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, lines) -> None:
+        """Send NDJSON with chunked transfer encoding, one chunk per line."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for obj in lines:
+            data = (json.dumps(obj) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path == "/":
+            body = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": m, "model": m} for m in self.server.models_seen]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": m, "model": m} for m in sorted(self.server.loaded)]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        req = self._read_json()
+        cfg = self.server.config
+        self.server.count(self.path)
+        model = req.get("model", "")
+        self.server.models_seen.add(model)
+        self.server.loaded.add(model if ":" in model else model + ":latest")
+
+        if self.path == "/api/embeddings":
+            time.sleep(cfg.embed_latency)
+            self._send_json({"embedding": fake_embedding(req.get("prompt", ""), cfg.dim)})
+        elif self.path == "/api/embed":
+            inputs = req.get("input", "")
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(cfg.embed_latency + cfg.embed_item_latency * len(inputs))
+            self._send_json({
+                "model": model,
+                "embeddings": [fake_embedding(t, cfg.dim) for t in inputs],
+            })
+        elif self.path in ("/api/chat", "/api/generate"):
+            self._generate(req, chat=self.path == "/api/chat")
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, req: dict, chat: bool) -> None:
+        cfg = self.server.config
+        model = req.get("model", "")
+        tokens = fake_reply_tokens(cfg.reply_tokens)
+        if chat:
+            prompt = " ".join(m.get("content", "") for m in req.get("messages", []))
+        else:
+            prompt = req.get("prompt", "")
+
+        def part(text: str, done: bool) -> dict:
+            out = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "done": done,
+            }
+            if chat:
+                out["message"] = {"role": "assistant", "content": text}
+            else:
+                out["response"] = text
+            if done:
+                out.update(
+                    done_reason="stop",
+                    prompt_eval_count=len(prompt.split()),
+                    prompt_eval_duration=int(cfg.first_token_latency * 1e9),
+                    eval_count=len(tokens),
+                    eval_duration=int(cfg.token_latency * len(tokens) * 1e9),
+                )
+            return out
+
+        if not req.get("stream", True):
+            time.sleep(cfg.first_token_latency + cfg.token_latency * max(len(tokens) - 1, 0))
+            self._send_json(part("".join(tokens), done=True))
+            return
+
+        def lines():
+            time.sleep(cfg.first_token_latency)
+            for i, tok in enumerate(tokens):
+                if i:
+                    time.sleep(cfg.token_latency)
+                yield part(tok, done=False)
+            yield part("", done=True)
+
+        self._send_stream(lines())
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that answers like Ollama and counts requests."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], config: FakeOllamaConfig):
+        super().__init__(address, _Handler)
+        self.config = config
+        self.models_seen = set()
+        self.loaded = set()
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def evict(self) -> None:
+        """Forget which models are loaded, like an Ollama restart."""
+        self.loaded.clear()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_ollama(
+    config: Optional[FakeOllamaConfig] = None,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> FakeOllamaServer:
+    """
+    Start a fake Ollama server on a background thread.
+
+    Args:
+        config: Latencies etc.; defaults to no added latency.
+        host, port: Where to listen (port 0 = any free port, see server.url).
+
+    Returns:
+        The running server; call shutdown() to stop it.
+    """
+    server = FakeOllamaServer((host, port), config or FakeOllamaConfig())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--embed-item-latency", type=float, default=0.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        (args.host, args.port),
+        FakeOllamaConfig(
+            dim=args.dim,
+            embed_latency=args.embed_latency,
+            embed_item_latency=args.embed_item_latency,
+            first_token_latency=args.first_token_latency,
+            token_latency=args.token_latency,
+            reply_tokens=args.reply_tokens,
+        ),
+    )
+    print(f"🦙 Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,110 @@
+"""
+Hot-swappable index for the API server.
+
+The server never uses module-level index globals directly. Each request takes
+the current IndexSnapshot once and uses it from start to finish, and a reload
+builds a complete new snapshot before swapping the reference. In-flight
+requests therefore finish on the snapshot they started with, while new
+requests see the new generation.
+"""
+import asyncio
+import os
+from typing import Optional
+
+import settings
+from index_store import ChunkIndex, current_generation, load_index
+from retrieval import RetrievalEngine
+
+
+class IndexNotReady(RuntimeError):
+    """Raised when the index is used before its first load finished."""
+
+
+def search_nprobe() -> int:
+    """nprobe for the RetrievalEngine, from SEARCH_MODE / IVF_NPROBE."""
+    if settings.SEARCH_MODE == "exact":
+        return 0
+    if settings.SEARCH_MODE == "ivf":
+        return max(settings.IVF_NPROBE, 1)
+    raise ValueError(f"SEARCH_MODE must be 'exact' or 'ivf', got {settings.SEARCH_MODE!r}")
+
+
+class IndexSnapshot:
+    """One loaded index generation plus everything built on top of it."""
+
+    def __init__(self, index: ChunkIndex):
+        self.index = index
+        self.engine = RetrievalEngine(
+            index, nprobe=search_nprobe(), rescore=max(settings.SEARCH_RESCORE, 0)
+        )
+
+    @classmethod
+    def load(cls, root: str) -> "IndexSnapshot":
+        return cls(load_index(root))
+
+    @property
+    def generation(self) -> str:
+        """Name of the generation directory this snapshot was loaded from."""
+        return os.path.basename(os.path.normpath(self.index.path))
+
+    @property
+    def version(self) -> str:
+        return self.index.version
+
+
+class IndexManager:
+    """
+    Owns the live IndexSnapshot and swaps in new generations.
+
+    Args:
+        root: Index root directory (see index_store.publish_index).
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._snapshot: Optional[IndexSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
+
+    @property
+    def snapshot(self) -> IndexSnapshot:
+        if self._snapshot is None:
+            raise IndexNotReady("index not loaded yet")
+        return self._snapshot
+
+    async def reload(self, force: bool = False) -> bool:
+        """
+        Load the live generation if it changed, then swap it in.
+
+        Loading happens in a worker thread; the swap itself is a single
+        reference assignment.
+
+        Args:
+            force: Reload even if CURRENT still names the loaded generation.
+
+        Returns:
+            True if a new snapshot was swapped in.
+        """
+        async with self._lock:
+            current = self._snapshot
+            if not force and current is not None:
+                # Plain (non-generational) index dirs only reload when forced
+                generation = current_generation(self.root)
+                if generation is None or generation == current.generation:
+                    return False
+            self._snapshot = await asyncio.to_thread(IndexSnapshot.load, self.root)
+            return True
+
+    async def watch(self, interval: float) -> None:
+        """Poll CURRENT every `interval` seconds and reload when it changes."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await self.reload():
+                    print(f"🔄 Loaded index generation {self.snapshot.generation}")
+            except Exception as e:
+                # Keep serving the old snapshot if the new one is broken
+                print(f"❌ Index reload failed, keeping the old one: {e!r}")
@@ -0,0 +1,360 @@
+"""
+Binary on-disk format for the chunk index.
+
+An index root directory holds one or more generations and a pointer to the
+live one:
+
+    CURRENT                      name of the live generation (its index_id)
+    generations/<index_id>/      one complete index, as described below
+
+publish_index() writes a new generation next to the old ones and then
+switches CURRENT with an atomic rename, so readers always see a complete
+index. A plain directory written by write_index() can be loaded as well.
+
+A generation directory contains:
+
+    embeddings.npy   contiguous float32 matrix, one L2-normalized row per chunk
+    texts.bin        all chunk texts, UTF-8 encoded and concatenated
+    meta.json        format version, index_id, ids, doc_ids, byte offsets
+                     into texts.bin and (optional) source page ranges
+    manifest.json    (optional) source file and chunk content hashes, used by
+                     build_index.py to re-embed only what changed
+    <name>.npy       (optional) extra arrays listed in meta.json, e.g. the
+                     IVF index from ann.py, the quantized embeddings from
+                     quantize.py or the BM25 postings from lexical.py
+
+The embedding matrix and the text blob are opened with mmap, so every worker
+process on one host shares the same page cache instead of holding its own copy.
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Bump this whenever the layout of the files below changes
+FORMAT_VERSION = 1
+
+EMBEDDINGS_FILE = "embeddings.npy"
+TEXTS_FILE = "texts.bin"
+META_FILE = "meta.json"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+
+
+class ChunkIndex:
+    """
+    Read-only view over an index directory written by write_index().
+
+    Attributes:
+        path: Directory the index was loaded from.
+        ids: Chunk ids, in row order.
+        doc_ids: doc_id of every chunk, in row order.
+        embeddings: (n_chunks, dim) float32 matrix (memory-mapped).
+    """
+
+    def __init__(self, path: str, meta: dict, embeddings: np.ndarray, texts):
+        self.path = path
+        self.meta = meta
+        self.ids: List[str] = meta["ids"]
+        self.doc_ids: List[str] = meta["doc_ids"]
+        self.embeddings = embeddings
+        self._texts = texts
+        self._offsets: List[int] = meta["text_offsets"]
+        self._pages: Optional[List] = meta.get("pages")
+
+    def array(self, name: str) -> Optional[np.ndarray]:
+        """Memory-map one of the extra arrays stored with the index, if present."""
+        if name not in self.meta.get("arrays", []):
+            return None
+        return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def version(self) -> str:
+        """Content fingerprint of this index; changes whenever it is rebuilt."""
+        return self.meta["index_id"]
+
+    @property
+    def dim(self) -> int:
+        return int(self.embeddings.shape[1])
+
+    def text(self, i: int) -> str:
+        """Decode the text of chunk i straight from the mmapped blob."""
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._texts[start:end]).decode("utf-8")
+
+    def chunk(self, i: int) -> Dict[str, str]:
+        """
+        Return chunk i as the {"id", "doc_id", "text"} dict used by the API,
+        plus "pages" ([first, last] source page) if the index records them.
+        """
+        chunk = {"id": self.ids[i], "doc_id": self.doc_ids[i], "text": self.text(i)}
+        if self._pages is not None and self._pages[i] is not None:
+            chunk["pages"] = self._pages[i]
+        return chunk
+
+
+def normalize_rows(embs: np.ndarray) -> np.ndarray:
+    """
+    Scale every row to unit length (float32).
+
+    Rows that already are unit-length are left bit-for-bit alone, so
+    re-publishing reused embeddings gives the same index_id.
+    """
+    embs = np.asarray(embs, dtype=np.float32)
+    if not embs.size:
+        return embs
+    norms = np.linalg.norm(embs, axis=1, keepdims=True)
+    return np.where(np.abs(norms - 1.0) > 1e-6, embs / (norms + 1e-10), embs)
+
+
+def write_index(
+    out_dir: str,
+    chunks: Sequence[dict],
+    embeddings,
+    model: str = "",
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+) -> str:
+    """
+    Write chunks + embeddings to out_dir in the binary index format.
+
+    Args:
+        out_dir: Directory to write into (created if missing).
+        chunks: Dicts with at least "id", "doc_id" and "text", and optionally
+                "pages" ([first, last] page of the source document).
+        embeddings: One embedding per chunk (list of lists or 2-D array).
+        model: Name of the embedding model, stored for reference.
+        arrays: Extra named arrays to store with the index (e.g. an ANN
+                index). They are part of the index_id.
+
+    Returns:
+        The index_id (content fingerprint) of what was written.
+    """
+    embs = np.asarray(embeddings, dtype=np.float32)
+    if len(chunks) == 0:
+        embs = embs.reshape(0, 0)
+    if embs.ndim != 2 or embs.shape[0] != len(chunks):
+        raise ValueError(
+            f"expected one embedding row per chunk, got shape {embs.shape} "
+            f"for {len(chunks)} chunks"
+        )
+
+    # Store unit-length rows, so cosine similarity is a plain dot product and
+    # the search engine never has to normalize (or copy) the mmapped matrix
+    embs = normalize_rows(embs)
+    arrays = arrays or {}
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Concatenate all texts into one blob and remember where each one starts
+    offsets = [0]
+    blobs = []
+    for c in chunks:
+        b = c["text"].encode("utf-8")
+        blobs.append(b)
+        offsets.append(offsets[-1] + len(b))
+
+    # Fingerprint of the whole index, so caches can tell generations apart
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(embs).tobytes())
+    for c, b in zip(chunks, blobs):
+        digest.update(f"{c['id']}\0{c['doc_id']}\0".encode("utf-8"))
+        digest.update(b)
+    pages = [c.get("pages") for c in chunks]
+    if any(p is not None for p in pages):
+        digest.update(json.dumps(pages).encode("utf-8"))
+    else:
+        pages = None
+    for name in sorted(arrays):
+        digest.update(name.encode("utf-8"))
+        digest.update(np.ascontiguousarray(arrays[name]).tobytes())
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "index_id": digest.hexdigest()[:16],
+        "model": model,
+        "count": len(chunks),
+        "dim": int(embs.shape[1]),
+        "dtype": "float32",
+        "normalized": True,
+        "ids": [c["id"] for c in chunks],
+        "doc_ids": [c["doc_id"] for c in chunks],
+        "text_offsets": offsets,
+        "arrays": sorted(arrays),
+    }
+    if pages is not None:
+        meta["pages"] = [list(p) if p is not None else None for p in pages]
+
+    # Write each file under a temporary name and rename it into place.
+    # meta.json goes last, so a reader never sees new metadata with old data.
+    emb_path = os.path.join(out_dir, EMBEDDINGS_FILE)
+    with open(emb_path + ".tmp", "wb") as f:
+        np.save(f, np.ascontiguousarray(embs))
+    os.replace(emb_path + ".tmp", emb_path)
+
+    for name, arr in arrays.items():
+        arr_path = os.path.join(out_dir, name + ".npy")
+        with open(arr_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(arr))
+        os.replace(arr_path + ".tmp", arr_path)
+
+    texts_path = os.path.join(out_dir, TEXTS_FILE)
+    with open(texts_path + ".tmp", "wb") as f:
+        for b in blobs:
+            f.write(b)
+    os.replace(texts_path + ".tmp", texts_path)
+
+    meta_path = os.path.join(out_dir, META_FILE)
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, separators=(",", ":"))
+    os.replace(meta_path + ".tmp", meta_path)
+
+    return meta["index_id"]
+
+
+def _write_json(path: str, obj) -> None:
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(obj, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def publish_index(
+    root: str,
+    chunks: Sequence[dict],
+    embeddings,
+    model: str = "",
+    manifest: Optional[dict] = None,
+    arrays: Optional[Dict[str, np.ndarray]] = None,
+    keep: int = 3,
+) -> str:
+    """
+    Write a new index generation under root and make it the live one.
+
+    The generation is fully written under a temporary name first, then
+    renamed into generations/<index_id>/, and only then is CURRENT switched
+    (atomically) to point at it. Servers still using an older generation keep
+    working off their mmaps until they reload.
+
+    Args:
+        root: Index root directory (e.g. "data/index").
+        chunks, embeddings, model, arrays: As for write_index().
+        manifest: Optional build manifest to store with the generation.
+        keep: Number of generations to keep on disk, including the new one.
+
+    Returns:
+        The index_id of the published generation.
+    """
+    gens_dir = os.path.join(root, GENERATIONS_DIR)
+    os.makedirs(gens_dir, exist_ok=True)
+
+    tmp_dir = os.path.join(gens_dir, f".tmp-{os.getpid()}-{time.time_ns()}")
+    index_id = write_index(tmp_dir, chunks, embeddings, model=model, arrays=arrays)
+    if manifest is not None:
+        _write_json(os.path.join(tmp_dir, MANIFEST_FILE), manifest)
+
+    gen_dir = os.path.join(gens_dir, index_id)
+    if os.path.isdir(gen_dir):
+        # Identical content was published before: keep that copy, it may be
+        # mmapped by a running server. Only refresh its manifest.
+        if manifest is not None:
+            _write_json(os.path.join(gen_dir, MANIFEST_FILE), manifest)
+        shutil.rmtree(tmp_dir)
+    else:
+        os.replace(tmp_dir, gen_dir)
+    os.utime(gen_dir)
+
+    # Switch the live generation
+    current_path = os.path.join(root, CURRENT_FILE)
+    with open(current_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(index_id + "\n")
+    os.replace(current_path + ".tmp", current_path)
+
+    # Drop old generations, newest first are kept
+    gens = [
+        d for d in os.listdir(gens_dir)
+        if not d.startswith(".") and d != index_id
+    ]
+    gens.sort(key=lambda d: os.path.getmtime(os.path.join(gens_dir, d)), reverse=True)
+    for d in gens[max(keep - 1, 0):]:
+        shutil.rmtree(os.path.join(gens_dir, d), ignore_errors=True)
+
+    return index_id
+
+
+def current_generation(root: str) -> Optional[str]:
+    """Name of the live generation under root, or None for a plain index dir."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve_index_dir(path: str) -> str:
+    """Directory holding the live index files for an index root (or plain dir)."""
+    gen = current_generation(path)
+    if gen is None:
+        return path
+    return os.path.join(path, GENERATIONS_DIR, gen)
+
+
+def read_manifest(index_dir: str) -> Optional[dict]:
+    """The build manifest stored with an index generation, if there is one."""
+    try:
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_index(path: str) -> ChunkIndex:
+    """
+    Open the live generation of an index root, or a plain index directory
+    written by write_index().
+
+    Args:
+        path: The index root or index directory.
+
+    Returns:
+        A ChunkIndex whose embeddings and texts are memory-mapped, read-only.
+    """
+    path = resolve_index_dir(path)
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(
+            f"No index found at {path!r}. Run build_index.py, or convert an "
+            f"old data/chunks.json with convert_index.py."
+        )
+
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+
+    version = meta.get("format_version")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"Index at {path!r} has format_version {version}, "
+            f"expected {FORMAT_VERSION}. Rebuild it with build_index.py."
+        )
+
+    embs = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+    if embs.dtype != np.float32 or embs.shape != (meta["count"], meta["dim"]):
+        raise ValueError(
+            f"embeddings.npy in {path!r} has shape {embs.shape} / {embs.dtype}, "
+            f"meta.json expects ({meta['count']}, {meta['dim']}) float32"
+        )
+
+    # np.memmap refuses zero-length files, so an empty index gets empty bytes
+    texts_path = os.path.join(path, TEXTS_FILE)
+    if os.path.getsize(texts_path) > 0:
+        texts = np.memmap(texts_path, dtype=np.uint8, mode="r")
+    else:
+        texts = b""
+
+    return ChunkIndex(path, meta, embs, texts)
@@ -0,0 +1,133 @@
+"""
+BM25 inverted index over chunk texts, for exact-term queries ("Employment
+Act", form numbers, leave types) and for answering without an embedding.
+
+build_bm25() runs in build_index.py; its arrays are stored next to the index
+files of a generation:
+
+    bm25_terms.npy         all terms, sorted, UTF-8 encoded and concatenated
+    bm25_term_offsets.npy  (n_terms + 1,) byte offsets into bm25_terms.npy
+    bm25_ptr.npy           (n_terms + 1,) start of each term's postings
+    bm25_rows.npy          posting rows (chunk row numbers), grouped by term
+    bm25_tf.npy            term frequency of every posting
+    bm25_doc_len.npy       (n_chunks,) number of tokens in each chunk
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+TERMS = "bm25_terms"
+TERM_OFFSETS = "bm25_term_offsets"
+PTR = "bm25_ptr"
+ROWS = "bm25_rows"
+TF = "bm25_tf"
+DOC_LEN = "bm25_doc_len"
+ARRAYS = (TERMS, TERM_OFFSETS, PTR, ROWS, TF, DOC_LEN)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased alphanumeric runs; "Form IR8A" -> ["form", "ir8a"]."""
+    return _TOKEN.findall(text.lower())
+
+
+def build_bm25(texts: Iterable[str]) -> Dict[str, np.ndarray]:
+    """
+    Build the BM25 postings for a list of chunk texts.
+
+    Args:
+        texts: Chunk texts, in row order.
+
+    Returns:
+        The arrays listed in the module docstring, ready to be stored with
+        the index (see index_store.publish_index).
+    """
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_len = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, tf))
+
+    terms = sorted(postings)
+    blobs = [t.encode("utf-8") for t in terms]
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in blobs], out=term_offsets[1:])
+    ptr = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(postings[t]) for t in terms], out=ptr[1:])
+
+    # Rows were added in row order, so every term's postings are sorted
+    flat = [p for t in terms for p in postings[t]]
+    return {
+        TERMS: np.frombuffer(b"".join(blobs), dtype=np.uint8),
+        TERM_OFFSETS: term_offsets,
+        PTR: ptr,
+        ROWS: np.asarray([r for r, _ in flat], dtype=np.int32),
+        TF: np.asarray([tf for _, tf in flat], dtype=np.int32),
+        DOC_LEN: np.asarray(doc_len, dtype=np.int32),
+    }
+
+
+class BM25Index:
+    """
+    Read side of the BM25 index.
+
+    Args:
+        arrays: The arrays written by build_bm25() (may be memory-mapped).
+        k1, b: BM25 parameters.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], k1: float = 1.2, b: float = 0.75):
+        blob = bytes(arrays[TERMS])
+        offsets = arrays[TERM_OFFSETS]
+        self.term_ids: Dict[str, int] = {
+            blob[offsets[i]:offsets[i + 1]].decode("utf-8"): i
+            for i in range(len(offsets) - 1)
+        }
+        self.ptr = arrays[PTR]
+        self.rows = arrays[ROWS]
+        self.tf = arrays[TF]
+
+        doc_len = np.asarray(arrays[DOC_LEN], dtype=np.float32)
+        self.n = len(doc_len)
+        avgdl = float(doc_len.mean()) if self.n else 1.0
+        self.k1 = k1
+        # Per-row length normalization, precomputed: k1 * (1 - b + b*dl/avgdl)
+        self._norm = k1 * (1.0 - b + b * doc_len / max(avgdl, 1e-6))
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Optional[np.ndarray]]) -> Optional["BM25Index"]:
+        """Build from stored arrays; None if the index has no BM25 data."""
+        if any(arrays.get(k) is None for k in ARRAYS):
+            return None
+        return cls(arrays)
+
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 scores of every chunk that contains at least one query term.
+
+        Returns:
+            (rows, scores), rows in ascending order.
+        """
+        ids = {self.term_ids[t] for t in tokenize(query) if t in self.term_ids}
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        parts_rows, parts_scores = [], []
+        for i in ids:
+            rows = self.rows[self.ptr[i]:self.ptr[i + 1]]
+            tf = self.tf[self.ptr[i]:self.ptr[i + 1]].astype(np.float32)
+            df = len(rows)
+            idf = np.log1p((self.n - df + 0.5) / (df + 0.5))
+            parts_rows.append(rows)
+            parts_scores.append(idf * tf * (self.k1 + 1.0) / (tf + self._norm[rows]))
+
+        # Sum the per-term contributions of every row
+        rows, inverse = np.unique(np.concatenate(parts_rows), return_inverse=True)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        np.add.at(scores, inverse, np.concatenate(parts_scores))
+        return rows.astype(np.int64), scores
@@ -1,20 +1,107 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
+import asyncio
+import httpx
 import json
 import numpy as np
-import requests
-import re  # <-- needed for regex formatting
+import ollama
+import time
+
+import settings
+from batching import MicroBatcher
+from cache import LRUCache, normalize_query
+from context import assemble_context, estimate_tokens
+from index_manager import IndexManager, IndexNotReady, IndexSnapshot
+from metrics import REGISTRY, TimingMiddleware, cache_collector, cache_lookup, note, record, span
+from ollama_api.ollama_client import ConcurrencyGate, OllamaOverloaded, OllamaService
+from ollama_api.ollama_functions import StreamingReplyFormatter, format_llm_reply
+from ollama_api.ollama_prompt import (  # your HR prompt wrapper
+    ERROR_REPLY,
+    MODEL,
+    PROMPT_VERSION,
+    build_messages,
+    ollama_failed,
+    query_ollama_async,
+    stream_ollama_async,
+)
+from retrieval import reciprocal_rank_fusion
+from warmup import ModelWarmer
+
+# ---- Shared Ollama client (one connection pool for the whole process) ----
+OLLAMA = OllamaService(
+    host=settings.OLLAMA_URL,
+    embed_model=settings.EMBED_MODEL,
+    chat_model=settings.CHAT_MODEL,
+    connect_timeout=settings.OLLAMA_CONNECT_TIMEOUT,
+    embed_timeout=settings.EMBED_TIMEOUT,
+    chat_timeout=settings.CHAT_TIMEOUT,
+    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+    max_keepalive=settings.OLLAMA_MAX_KEEPALIVE,
+    embed_gate=ConcurrencyGate(
+        "embed",
+        settings.EMBED_MAX_CONCURRENT,
+        settings.EMBED_MAX_WAITING,
+        settings.QUEUE_WAIT_TIMEOUT,
+    ),
+    chat_gate=ConcurrencyGate(
+        "chat",
+        settings.CHAT_MAX_CONCURRENT,
+        settings.CHAT_MAX_WAITING,
+        settings.QUEUE_WAIT_TIMEOUT,
+    ),
+    keep_alive=settings.OLLAMA_KEEP_ALIVE,
+)
+
+
+# ---- Model warm-up (see warmup.py) ----
+# The warm-up question is laid out like a real one, so Ollama has the system
+# prompt prefix cached before the first request
+WARMER = ModelWarmer(
+    OLLAMA,
+    chat_messages=build_messages("", "Hi"),
+    check_interval=settings.MODEL_CHECK_INTERVAL,
+)
+
+
+async def load_index() -> None:
+    """Initial index load, off the event loop; failures leave /readyz at 503."""
+    start = time.perf_counter()
+    try:
+        await INDEXES.reload(force=True)
+    except Exception as e:
+        print(f"❌ Could not load the index from {settings.INDEX_DIR}: {e!r}")
+        return
+    snapshot = INDEXES.snapshot
+    print(
+        f"📚 Loaded index generation {snapshot.generation} ({len(snapshot.index)} chunks) "
+        f"in {time.perf_counter() - start:.1f}s"
+    )
+
 
-from ollama_api.ollama_prompt import query_ollama  # your HR prompt wrapper
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start serving straight away (/healthz answers, /readyz says 503) while
+    # the index loads and the models warm up in the background
+    tasks = [asyncio.create_task(load_index())]
+    if settings.MODEL_WARMUP:
+        tasks.append(asyncio.create_task(WARMER.run()))
+    # Pick up newly published index generations (or retry a failed first load)
+    if settings.INDEX_WATCH_INTERVAL > 0:
+        tasks.append(asyncio.create_task(INDEXES.watch(settings.INDEX_WATCH_INTERVAL)))
+    yield
+    for task in tasks:
+        task.cancel()
+    # Close pooled connections on shutdown
+    await OLLAMA.aclose()
 
-# ---- Embedding / Ollama config ----
-EMBED_MODEL = "nomic-embed-text"
-OLLAMA_URL = "http://localhost:11434"
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS so your frontend can call this API
 app.add_middleware(
@@ -25,88 +112,206 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ---- Load precomputed chunks index on startup ----
-with open("data/chunks.json", "r", encoding="utf-8") as f:
-    CHUNKS = json.load(f)
+# ---- Precomputed chunks index, loaded by lifespan() ----
+# Embeddings and texts are memory-mapped, so workers share one copy in RAM.
+# INDEXES.snapshot is swapped (not mutated) when a new generation is loaded.
+INDEXES = IndexManager(settings.INDEX_DIR)
+
+# ---- Caches (see cache.py) ----
+EMBED_CACHE = LRUCache(
+    "query_embeddings",
+    max_entries=settings.EMBED_CACHE_MAX_ENTRIES,
+    max_bytes=settings.EMBED_CACHE_MAX_BYTES,
+    ttl=settings.EMBED_CACHE_TTL,
+)
+ANSWER_CACHE = LRUCache(
+    "answers",
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    max_bytes=settings.ANSWER_CACHE_MAX_BYTES,
+    ttl=settings.ANSWER_CACHE_TTL,
+)
+REGISTRY.add_collector(cache_collector([EMBED_CACHE, ANSWER_CACHE]))
+
 
-# All embeddings in a single matrix for fast similarity search
-EMBS = np.array([c["embedding"] for c in CHUNKS])
+# ---- Micro-batching (see batching.py) ----
+# Concurrent cache misses share one /api/embed call, and concurrent dense
+# searches of the same index with the same filter one matrix-matrix product.
+async def _embed_texts(key, texts: List[str]) -> List[List[float]]:
+    return await OLLAMA.embed_batch(texts)
 
 
-def get_query_embedding(text: str) -> np.ndarray:
+async def _search_queries(key, q_embs: List[np.ndarray]):
+    engine, top_k, doc_ids = key
+    return await asyncio.to_thread(
+        engine.search_batch, np.stack(q_embs), top_k, list(doc_ids) or None
+    )
+
+
+EMBED_BATCHER = MicroBatcher(
+    "embed", _embed_texts, settings.EMBED_BATCH_MAX, settings.EMBED_BATCH_WINDOW_MS / 1000
+)
+SEARCH_BATCHER = MicroBatcher(
+    "search", _search_queries, settings.SEARCH_BATCH_MAX, settings.SEARCH_BATCH_WINDOW_MS / 1000
+)
+
+
+async def _embed(text: str) -> np.ndarray:
+    try:
+        if settings.EMBED_BATCH_WINDOW_MS > 0:
+            emb = await EMBED_BATCHER.submit(text)
+        else:
+            emb = await OLLAMA.embed(text)
+    except (
+        ConnectionError, httpx.HTTPError, asyncio.TimeoutError, ollama.ResponseError, ValueError,
+    ) as e:
+        # Without a query embedding we cannot search, so report Ollama as down
+        ollama_failed("embed", e)
+        raise HTTPException(status_code=503, detail="Embedding service unavailable")
+    return np.asarray(emb, dtype=np.float32)
+
+
+async def get_query_embedding(text: str) -> np.ndarray:
     """
     Call Ollama's embedding API to get an embedding vector for the query text.
+    Results are cached on the normalized text, and identical concurrent
+    queries share one embedding call.
+    """
+    with span("embed"):
+        return await EMBED_CACHE.get_or_compute(
+            normalize_query(text),
+            lambda: _embed(text),
+            on_result=lambda result: cache_lookup("embed_cache", result),
+        )
+
+
+def answer_cache_key(
+    snapshot: IndexSnapshot,
+    message: str,
+    doc_ids: Optional[List[str]],
+    chunks: List[dict],
+) -> tuple:
+    """
+    Answer cache key. It includes everything that goes into the LLM call, so
+    a rebuilt index (new index version / chunk ids), a different model, a
+    changed prompt or context budget never serve a stale answer.
     """
-    r = requests.post(
-        f"{OLLAMA_URL}/api/embeddings",
-        json={"model": EMBED_MODEL, "prompt": text},
+    return (
+        normalize_query(message),
+        tuple(sorted(set(doc_ids or []))),
+        snapshot.version,
+        tuple(c["id"] for c in chunks),
+        MODEL,
+        PROMPT_VERSION,
+        settings.CONTEXT_MAX_TOKENS,
     )
-    r.raise_for_status()
-    return np.array(r.json()["embedding"])
 
 
-def retrieve_chunks(
+def build_context(chunks: List[dict]) -> str:
+    """
+    Database context for the LLM: overlapping neighbour chunks merged, cut
+    to settings.CONTEXT_MAX_TOKENS (see context.py).
+    """
+    with span("context"):
+        db_context = assemble_context(chunks, settings.CONTEXT_MAX_TOKENS)
+    note(context_tokens=estimate_tokens(db_context))
+    return db_context
+
+
+async def retrieve_chunks(
     query: str,
     top_k: int = 4,
     allowed_docs: Optional[List[str]] = None,
+    snapshot: Optional[IndexSnapshot] = None,
 ):
     """
     Retrieve the top_k most relevant chunks from the index for a given query,
     optionally restricted to certain doc_ids.
-    """
-    q_emb = get_query_embedding(query)
-
-    if allowed_docs:
-        idxs = [i for i, c in enumerate(CHUNKS) if c["doc_id"] in allowed_docs]
-        if not idxs:
-            return []
-        embs = EMBS[idxs]
-    else:
-        idxs = list(range(len(CHUNKS)))
-        embs = EMBS
 
-    # Cosine similarity between query embedding and each chunk embedding
-    sims = embs @ q_emb / (
-        np.linalg.norm(embs, axis=1) * np.linalg.norm(q_emb) + 1e-10
-    )
+    Depending on settings.RETRIEVAL_MODE this is embedding search, BM25, or
+    both fused with reciprocal rank fusion. In hybrid mode BM25 runs while the
+    query embedding is computed, and answers alone if the embedding service
+    is slow or down.
 
-    top_idx = np.argsort(-sims)[:top_k]
-    return [CHUNKS[idxs[i]] for i in top_idx]
+    Pass the request's snapshot so everything in one request sees the same
+    index generation; by default the live one is used.
+    """
+    snapshot = snapshot or INDEXES.snapshot
+    with span("retrieve"):
+        hits = await _search(snapshot, query, top_k, allowed_docs)
+    chunks = [snapshot.index.chunk(i) for i, _ in hits]
+    note(chunk_ids=[c["id"] for c in chunks])
+    return chunks
 
 
-def format_llm_reply(text: str) -> str:
+async def _in_thread(stage: str, fn, *args, **kwargs):
     """
-    Post-process the LLM reply to make it easier to read:
-
-    - Put bold headings like **Something** on their own lines.
-    - Put each bullet (• or *) on its own line.
-    - Collapse excessive blank lines.
+    Run a search in a worker thread, so a big corpus never blocks the event
+    loop, and record its time as one stage of the request.
     """
-    # Make sure we are dealing with a string
-    if not isinstance(text, str):
-        text = str(text)
+    start = time.perf_counter()
+    try:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    finally:
+        record(stage, time.perf_counter() - start)
 
-    if not text:
-        return text
 
-    # 1) Headings: bold phrases starting with a capital letter → separate block
-    #    e.g. "**Supporting Individual Employees...**" or "**Summary**"
-    def heading_repl(match):
-        heading = match.group(1).strip()
-        return f"\n\n**{heading}**\n\n"
-
-    # Only treat bold segments that look like headings (start with capital)
-    text = re.sub(r"\*\*([A-Z][^*]+?)\*\*", heading_repl, text)
+async def _dense_search(
+    engine, q_emb: np.ndarray, top_k: int, allowed_docs: Optional[List[str]]
+):
+    """Embedding search, batched with concurrent searches when enabled."""
+    if settings.SEARCH_BATCH_WINDOW_MS <= 0:
+        return await _in_thread(
+            "search", engine.search, q_emb, top_k=top_k, doc_ids=allowed_docs
+        )
+    start = time.perf_counter()
+    try:
+        key = (engine, top_k, tuple(sorted(set(allowed_docs or []))))
+        return await SEARCH_BATCHER.submit(q_emb, key)
+    finally:
+        record("search", time.perf_counter() - start)
+
+
+async def _search(
+    snapshot: IndexSnapshot,
+    query: str,
+    top_k: int,
+    allowed_docs: Optional[List[str]],
+):
+    """(row, score) hits for retrieve_chunks, per settings.RETRIEVAL_MODE."""
+    engine = snapshot.engine
+    mode = settings.RETRIEVAL_MODE if engine.bm25 is not None else "dense"
 
-    # 2) Ensure bullets are on their own line
-    # "* text" or "• text" → newline before them
-    text = re.sub(r"\s*\*\s+", r"\n* ", text)   # markdown bullets
-    text = re.sub(r"\s*•\s+", r"\n• ", text)    # unicode bullets
+    if mode == "lexical":
+        return await _in_thread("lexical", engine.lexical_search, query, top_k, allowed_docs)
 
-    # 3) Collapse 3+ newlines into 2
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    if mode != "hybrid":
+        q_emb = await get_query_embedding(query)
+        return await _dense_search(engine, q_emb, top_k, allowed_docs)
 
-    return text.strip()
+    depth = max(top_k, settings.HYBRID_DEPTH)
+    lexical = asyncio.ensure_future(
+        _in_thread("lexical", engine.lexical_search, query, depth, allowed_docs)
+    )
+    try:
+        timeout = settings.EMBED_FALLBACK_TIMEOUT or None
+        try:
+            q_emb = await asyncio.wait_for(get_query_embedding(query), timeout)
+        except (asyncio.TimeoutError, OllamaOverloaded, HTTPException) as e:
+            # No embedding (yet): answer from BM25 if it found anything. A slow
+            # embedding keeps running and lands in EMBED_CACHE for next time.
+            lex_hits = await lexical
+            if lex_hits:
+                print(f"⚠ Query embedding unavailable ({type(e).__name__}), using BM25 only")
+                note(retrieval="lexical_fallback")
+                return lex_hits[:top_k]
+            if not isinstance(e, asyncio.TimeoutError):
+                raise
+            q_emb = await get_query_embedding(query)
+
+        dense_hits = await _dense_search(engine, q_emb, depth, allowed_docs)
+        return reciprocal_rank_fusion([dense_hits, await lexical], top_k)
+    finally:
+        lexical.cancel()
 
 
 class ChatRequest(BaseModel):
@@ -124,39 +329,222 @@ class ChatResponse(BaseModel):
     reply: str
 
 
+@app.exception_handler(OllamaOverloaded)
+async def ollama_overloaded_handler(request: Request, exc: OllamaOverloaded):
+    """Too many requests queued for Ollama: answer fast with 429/503."""
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(IndexNotReady)
+async def index_not_ready_handler(request: Request, exc: IndexNotReady):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Index not loaded yet"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "FastAPI HR backend is running on 8000"}
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and its event loop answers."""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """
+    Readiness: 200 once the index is loaded and both Ollama models are warm
+    (see warmup.py), 503 before that or while an evicted model is re-warmed.
+    """
+    index_ready = INDEXES.loaded
+    body = {"index": INDEXES.snapshot.generation if index_ready else None}
+    ready = index_ready
+    if settings.MODEL_WARMUP:
+        body.update(WARMER.status())
+        ready = ready and WARMER.ready
+    body["ready"] = ready
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     """
     Main chat endpoint:
       1. Retrieve relevant chunks (RAG).
-      2. Build database_context from chunk texts.
+      2. Build database_context from chunk texts (merged, within budget).
       3. Call Ollama with HR prompt.
       4. Post-process reply for readability.
     """
-    # 1) Retrieve relevant chunks
-    chunks = retrieve_chunks(
+    # 1) Retrieve relevant chunks (from one index snapshot for the whole request)
+    snapshot = INDEXES.snapshot
+    chunks = await retrieve_chunks(
         query=req.message,
         top_k=4,
         allowed_docs=req.doc_ids,
+        snapshot=snapshot,
     )
 
-    if chunks:
-        db_context = "\n\n---\n\n".join(c["text"] for c in chunks)
-    else:
-        db_context = ""
-
-    # 2) Call Ollama via your helper
-    reply_text = query_ollama(
-        database_context=db_context,
-        user_query=req.message,
+    db_context = build_context(chunks)
+
+    # 2) Call Ollama via your helper (or reuse a cached answer). Identical
+    #    concurrent questions share a single generation.
+    reply_text = await ANSWER_CACHE.get_or_compute(
+        answer_cache_key(snapshot, req.message, req.doc_ids, chunks),
+        lambda: query_ollama_async(
+            OLLAMA,
+            database_context=db_context,
+            user_query=req.message,
+        ),
+        should_cache=lambda reply: reply != ERROR_REPLY,
+        on_result=lambda result: cache_lookup("answer_cache", result),
     )
 
     # 3) Clean up formatting for UI
-    reply_text = format_llm_reply(reply_text)
+    with span("format"):
+        reply_text = format_llm_reply(reply_text)
 
     return ChatResponse(reply=reply_text)
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Streaming chat endpoint. Same steps as /chat, but the reply is sent as
+    newline-delimited JSON while the LLM is still generating:
+
+        {"delta": "<formatted text>"}   (zero or more)
+        {"done": true}                  (last line)
+
+    Joining all "delta" values gives the same text /chat would return.
+    """
+    # 1) Retrieve relevant chunks (from one index snapshot for the whole request)
+    snapshot = INDEXES.snapshot
+    chunks = await retrieve_chunks(
+        query=req.message,
+        top_k=4,
+        allowed_docs=req.doc_ids,
+        snapshot=snapshot,
+    )
+    db_context = build_context(chunks)
+
+    # A cached answer is sent as a single delta
+    cache_key = answer_cache_key(snapshot, req.message, req.doc_ids, chunks)
+    cached = ANSWER_CACHE.get(cache_key)
+    if cached is not None:
+        cache_lookup("answer_cache", "hit")
+        async def cached_ndjson():
+            reply = format_llm_reply(cached)
+            if reply:
+                yield json.dumps({"delta": reply}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+
+        return StreamingResponse(cached_ndjson(), media_type="application/x-ndjson")
+
+    # 2) Start the Ollama stream (or join the identical one already running;
+    #    completed streams fill the answer cache for later /chat calls too).
+    #    Wait for the first piece here, before the response starts, so a full
+    #    chat queue is still a proper 429/503.
+    pieces = ANSWER_CACHE.stream(
+        cache_key,
+        lambda: stream_ollama_async(OLLAMA, db_context, req.message),
+        should_cache=lambda raw: ERROR_REPLY not in raw,
+        on_result=lambda result: cache_lookup("answer_cache", result),
+    )
+    try:
+        first = await pieces.__anext__()
+    except StopAsyncIteration:
+        first = ""
+
+    # 3) Format incrementally and relay each finalized piece as it arrives
+    async def ndjson():
+        formatter = StreamingReplyFormatter()
+        format_seconds = 0.0
+
+        def feed(piece: Optional[str]) -> str:
+            # Time spent formatting, summed over the whole stream
+            nonlocal format_seconds
+            start = time.perf_counter()
+            out = formatter.feed(piece) if piece is not None else formatter.flush()
+            format_seconds += time.perf_counter() - start
+            return out
+
+        try:
+            out = feed(first)
+            if out:
+                yield json.dumps({"delta": out}) + "\n"
+            async for piece in pieces:
+                out = feed(piece)
+                if out:
+                    yield json.dumps({"delta": out}) + "\n"
+            out = feed(None)
+            if out:
+                yield json.dumps({"delta": out}) + "\n"
+            yield json.dumps({"done": True}) + "\n"
+            record("format", format_seconds)
+        finally:
+            # Stop reading the shared stream now if the client went away
+            await pieces.aclose()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+def check_admin(token: Optional[str]) -> None:
+    """Reject admin calls without the right X-Admin-Token (if one is set)."""
+    if settings.ADMIN_TOKEN and token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.post("/admin/reload")
+async def reload_index(
+    force: bool = False,
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """
+    Swap in the index generation published last by build_index.py.
+    Requests already running finish on the old one.
+    """
+    check_admin(x_admin_token)
+    swapped = await INDEXES.reload(force=force)
+    snapshot = INDEXES.snapshot
+    return {
+        "reloaded": swapped,
+        "generation": snapshot.generation,
+        "index_version": snapshot.version,
+        "chunks": len(snapshot.index),
+        "search_mode": snapshot.engine.mode,
+        "bm25": snapshot.engine.bm25 is not None,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Prometheus metrics: request and per-stage latency histograms, cache
+    lookups, Ollama errors and LLM token counts (this worker process only).
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/cache")
+def cache_stats(x_admin_token: Optional[str] = Header(default=None)):
+    """Hit/miss counters and sizes of the embedding and answer caches."""
+    check_admin(x_admin_token)
+    return {"caches": [EMBED_CACHE.stats(), ANSWER_CACHE.stats()]}
+
+
+# ---- Per-request timing (Server-Timing header, /metrics, slow-request log) ----
+# Added last, so it wraps everything else and knows every route's path
+app.add_middleware(
+    TimingMiddleware,
+    endpoints=[route.path for route in app.routes],
+    slow_seconds=settings.SLOW_REQUEST_SECONDS,
+)
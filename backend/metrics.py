@@ -0,0 +1,319 @@
+"""
+Per-request stage timings and Prometheus-format metrics for the chat path.
+
+Each HTTP request gets a RequestTimings (set up by TimingMiddleware and kept
+in a contextvar). Code anywhere on the request path records a stage with
+
+    with span("embed"):
+        ...
+
+which adds the time to the request's Server-Timing header (stages that end
+before the response starts) and to the stage_seconds histogram. Streamed
+responses keep recording after the headers are sent; those stages only show
+up in the histograms and in the slow-request log.
+
+Metrics are per process: with several uvicorn workers, each one is scraped
+(or summed) separately.
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    Monotonic counter with labels.
+
+    Args:
+        name: Metric name (without the _total suffix).
+        help: One-line description.
+        labelnames: Label names; inc() takes the values as keyword arguments.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name}_total {self.help}", f"# TYPE {self.name}_total counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, v in items:
+            lines.append(f"{self.name}_total{_labels(self.labelnames, key)} {_num(v)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram with labels.
+
+    Args:
+        name: Metric name.
+        help: One-line description.
+        labelnames: Label names; observe() takes the values as keyword arguments.
+        buckets: Upper bounds of the buckets, ascending (+Inf is added).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        # label values -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, row in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, row):
+                cumulative += n
+                le = f'le="{_num(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_num(row[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {row[-1]}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process, plus collectors called at scrape time."""
+
+    def __init__(self):
+        self.metrics: List = []
+        self.collectors: List[Callable[[], Iterable[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]) -> None:
+        """collector() returns extra exposition lines (e.g. cache gauges)."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self.metrics:
+            lines.extend(m.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "hr_requests", "HTTP requests handled.", ("endpoint", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "hr_request_seconds", "Total HTTP request time, including streamed bodies.", ("endpoint",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "hr_stage_seconds", "Time spent in each stage of a request.", ("stage",)))
+CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "hr_cache_lookups", "Cache lookups on the request path.", ("cache", "result")))
+OLLAMA_ERRORS = REGISTRY.register(Counter(
+    "hr_ollama_errors", "Failed Ollama calls.", ("op", "error")))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "hr_llm_tokens", "Tokens processed by the chat model, from Ollama's eval stats.", ("kind",)))
+SLOW_REQUESTS = REGISTRY.register(Counter(
+    "hr_slow_requests", "Requests slower than SLOW_REQUEST_SECONDS.", ("endpoint",)))
+
+
+class RequestTimings:
+    """Stage durations and notes collected while handling one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.notes: Dict[str, object] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages.append((stage, seconds))
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Seconds per stage name (stages that ran more than once are summed)."""
+        totals: Dict[str, float] = {}
+        for name, seconds in self.stages:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def server_timing(self) -> str:
+        """Server-Timing header value: stages so far plus cache results."""
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages]
+        for cache in ("embed_cache", "answer_cache"):
+            if cache in self.notes:
+                parts.append(f'{cache};desc="{self.notes[cache]}"')
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current() -> Optional[RequestTimings]:
+    """The RequestTimings of the request being handled, if any."""
+    return _current.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Time the block as one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def note(**values) -> None:
+    """Attach values (cache results, chunk ids, ...) to the current request."""
+    timings = _current.get()
+    if timings is not None:
+        timings.notes.update(values)
+
+
+def cache_lookup(cache: str, result: str) -> None:
+    """
+    Count a cache lookup ("hit", "miss" or "shared") and show it in the
+    request's Server-Timing.
+    """
+    CACHE_LOOKUPS.inc(cache=cache, result=result)
+    note(**{cache: result})
+
+
+def cache_collector(caches) -> Callable[[], List[str]]:
+    """Collector exporting size and eviction stats of LRUCaches (see cache.py)."""
+    def collect() -> List[str]:
+        stats = [c.stats() for c in caches]
+        lines = []
+        for metric, kind, field, help in (
+            ("hr_cache_entries", "gauge", "entries", "Entries held by each cache."),
+            ("hr_cache_bytes", "gauge", "bytes", "Approximate bytes held by each cache."),
+            ("hr_cache_evictions_total", "counter", "evictions", "Entries evicted to fit."),
+        ):
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+            lines += [f'{metric}{{cache="{s["name"]}"}} {s[field]}' for s in stats]
+        return lines
+    return collect
+
+
+class TimingMiddleware:
+    """
+    ASGI middleware that times every HTTP request.
+
+    Adds a Server-Timing header, counts requests per endpoint and status,
+    and logs requests slower than slow_seconds (with their notes, e.g. the
+    retrieved chunk ids) as one JSON line.
+
+    Args:
+        app: The ASGI app to wrap.
+        endpoints: Paths reported as their own endpoint label; others are
+                   reported as "other" to keep label cardinality bounded.
+        slow_seconds: Slow-request log threshold (0 = off).
+    """
+
+    def __init__(self, app, endpoints: Iterable[str], slow_seconds: float = 0.0):
+        self.app = app
+        self.endpoints = set(endpoints)
+        self.slow_seconds = slow_seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope.get("path", "")
+        endpoint = path if path in self.endpoints else "other"
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_timed(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                value = timings.server_timing()
+                if value:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", value.encode("latin-1")))
+                    message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - timings.start
+            REQUESTS.inc(endpoint=endpoint, status=status)
+            REQUEST_SECONDS.observe(total, endpoint=endpoint)
+            if self.slow_seconds and total >= self.slow_seconds:
+                SLOW_REQUESTS.inc(endpoint=endpoint)
+                print("🐢 Slow request " + json.dumps({
+                    "path": path,
+                    "status": status,
+                    "total_ms": round(total * 1000, 1),
+                    "stages_ms": {
+                        name: round(s * 1000, 1) for name, s in timings.stage_totals().items()
+                    },
+                    **timings.notes,
+                }))
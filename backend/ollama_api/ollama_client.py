@@ -0,0 +1,184 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional, Union
+
+import httpx
+import ollama
+
+
+class OllamaOverloaded(Exception):
+    """
+    Raised when a request could not get an Ollama slot.
+
+    Attributes:
+        status_code: 429 if the wait queue was full, 503 if we waited too long.
+        retry_after: Suggested number of seconds before retrying.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int = 1):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class ConcurrencyGate:
+    """
+    Bounded concurrency limiter with a bounded wait queue.
+
+    At most `max_concurrent` callers hold a slot at once and at most
+    `max_waiting` more wait for one. Callers beyond that are rejected
+    immediately, so a traffic spike turns into fast 429s instead of an
+    ever-growing pile of requests stuck behind the LLM.
+
+    Args:
+        name: Used in error messages ("chat", "embed", ...).
+        max_concurrent: Number of simultaneous slots.
+        max_waiting: Maximum number of callers queued for a slot.
+        wait_timeout: Seconds a queued caller waits before giving up.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_waiting: int, wait_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._sem = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        # Admit or reject before the first await: callers arriving in the same
+        # event-loop tick must all see each other in the counters
+        if self.in_flight + self.waiting >= self.max_concurrent + self.max_waiting:
+            raise OllamaOverloaded(f"Ollama {self.name} queue is full", status_code=429)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            raise OllamaOverloaded(
+                f"Timed out waiting for an Ollama {self.name} slot",
+                status_code=503,
+                retry_after=int(self.wait_timeout),
+            ) from None
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+
+class OllamaService:
+    """
+    One shared, connection-pooled async Ollama client for the whole process,
+    with separate concurrency gates for embeddings and chat.
+
+    Args:
+        host: Ollama base URL, e.g. "http://localhost:11434".
+        embed_model: Model used for query embeddings.
+        chat_model: Model used for answers.
+        connect_timeout: Seconds to wait for a TCP connection.
+        embed_timeout: Seconds allowed for one embedding call.
+        chat_timeout: Seconds allowed for one (non-streaming) chat call.
+        max_connections: Size of the HTTP connection pool.
+        max_keepalive: Idle connections kept open in the pool.
+        embed_gate: Limiter in front of embedding calls.
+        chat_gate: Limiter in front of chat calls.
+        keep_alive: How long Ollama keeps the models loaded after a call
+                    (seconds or a duration like "30m"; None = Ollama's default).
+    """
+
+    def __init__(
+        self,
+        host: str,
+        embed_model: str,
+        chat_model: str,
+        connect_timeout: float,
+        embed_timeout: float,
+        chat_timeout: float,
+        max_connections: int,
+        max_keepalive: int,
+        embed_gate: ConcurrencyGate,
+        chat_gate: ConcurrencyGate,
+        keep_alive: Union[float, str, None] = None,
+    ):
+        self.embed_model = embed_model
+        self.chat_model = chat_model
+        self.embed_timeout = embed_timeout
+        self.embed_gate = embed_gate
+        self.chat_gate = chat_gate
+        self.keep_alive = keep_alive
+        self.client = ollama.AsyncClient(
+            host=host,
+            timeout=httpx.Timeout(chat_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+            ),
+        )
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed one piece of text with the embedding model."""
+        async with self.embed_gate.slot():
+            resp = await asyncio.wait_for(
+                self.client.embeddings(
+                    model=self.embed_model, prompt=text, keep_alive=self.keep_alive
+                ),
+                timeout=self.embed_timeout,
+            )
+        return resp["embedding"]
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed many texts in one /api/embed call (one embed slot for all)."""
+        async with self.embed_gate.slot():
+            resp = await asyncio.wait_for(
+                self.client.embed(
+                    model=self.embed_model, input=texts, keep_alive=self.keep_alive
+                ),
+                timeout=self.embed_timeout,
+            )
+        embeddings = resp["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"asked for {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    async def chat(
+        self, messages: List[dict], model: Optional[str] = None, options: Optional[dict] = None
+    ):
+        """Run one non-streaming chat completion and return Ollama's response."""
+        async with self.chat_gate.slot():
+            return await self.client.chat(
+                model=model or self.chat_model,
+                messages=messages,
+                options=options,
+                keep_alive=self.keep_alive,
+            )
+
+    async def chat_stream(self, messages: List[dict], model: Optional[str] = None):
+        """
+        Run one streaming chat completion, yielding Ollama's partial responses.
+
+        The chat slot is held until the stream is finished or closed.
+        """
+        async with self.chat_gate.slot():
+            stream = await self.client.chat(
+                model=model or self.chat_model,
+                messages=messages,
+                stream=True,
+                keep_alive=self.keep_alive,
+            )
+            async for part in stream:
+                yield part
+
+    async def loaded_models(self) -> List[str]:
+        """Names of the models Ollama has in memory right now (/api/ps)."""
+        resp = await asyncio.wait_for(self.client.ps(), timeout=self.embed_timeout)
+        return [m.get("model") or m.get("name") for m in resp.get("models", [])]
+
+    async def aclose(self) -> None:
+        await self.client.close()
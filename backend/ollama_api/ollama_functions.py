@@ -1,30 +1,156 @@
 import re
+from typing import List, Tuple
+
+# Longest text between the ** of a heading; longer bold text, or bold text
+# with a line break, is emphasis in a paragraph and not a heading
+HEADING_MAX_CHARS = 80
+# Longest heading including its two "**"
+HEADING_SPAN = HEADING_MAX_CHARS + 4
+
+# Bold phrases starting with a capital letter, e.g. "**Summary**"
+HEADING_RE = re.compile(r"\*\*([A-Z][^*\n]{1,%d}?)\*\*" % (HEADING_MAX_CHARS - 1))
+# A heading that has been opened but not closed yet at the end of the text
+OPEN_HEADING_RE = re.compile(r"\*\*[A-Z][^*\n]{0,%d}\Z" % (HEADING_MAX_CHARS - 1))
+
+
+def _heading_repl(match: re.Match) -> str:
+    heading = match.group(1).strip()
+    return f"\n\n**{heading}**\n\n"
+
+
+def _normalize(text: str) -> str:
+    """All of format_llm_reply except the final strip()."""
+    # 1) Headings: bold phrases starting with a capital letter → separate block
+    # e.g. "**Supporting Individual Employees...**" or "**Summary**"
+    text = HEADING_RE.sub(_heading_repl, text)
+
+    # 2) Ensure bullets are on their own line
+    #    "* text" or "• text" → newline before them
+    text = re.sub(r"\s*\*\s+", r"\n* ", text)   # markdown bullets
+    text = re.sub(r"\s*•\s+", r"\n• ", text)    # unicode bullets
+
+    # 3) Collapse 3+ newlines into 2
+    text = re.sub(r"\n{3,}", "\n\n", text)
+
+    return text
+
 
 def format_llm_reply(text: str) -> str:
     """
     Post-process the LLM reply to make it easier to read:
 
-    - Put bold headings like **Something** on their own lines.
+    - Put bold headings like **Something** on their own lines (a heading
+      is one line of at most HEADING_MAX_CHARS characters).
     - Put each bullet (• or *) on its own line.
     - Collapse excessive blank lines.
     """
+    # Make sure we are dealing with a string
+    if not isinstance(text, str):
+        text = str(text)
+
     if not text:
         return text
 
-    # 1) Headings: bold phrases starting with a capital letter → separate block
-    # e.g. "**Supporting Individual Employees...**" or "**Summary**"
-    def heading_repl(match: re.Match) -> str:
-        heading = match.group(1).strip()
-        return f"\n\n**{heading}**\n\n"
+    return _normalize(text).strip()
 
-    text = re.sub(r"\*\*([A-Z][^*]+?)\*\*", heading_repl, text)
 
-    # 2) Ensure bullets are on their own line
-    #    "* text" or "• text" → newline before them
-    text = re.sub(r"\s*\*\s+", r"\n* ", text)   # markdown bullets
-    text = re.sub(r"\s*•\s+", r"\n• ", text)    # unicode bullets
+def _is_plain(ch: str) -> bool:
+    # Characters no formatting rule can match on: not whitespace, "*" or "•"
+    return not ch.isspace() and ch != "*" and ch != "•"
 
-    # 3) Collapse 3+ newlines into 2
-    text = re.sub(r"\n{3,}", "\n\n", text)
 
-    return text.strip()
+class StreamingReplyFormatter:
+    """
+    Incremental version of format_llm_reply for streamed LLM output.
+
+    Feed it pieces of the reply as they arrive and it returns the formatted
+    text that is already final. Concatenating every feed() result and the
+    flush() result gives exactly format_llm_reply(full_text).
+
+    Only a short tail is kept back: text is released up to the last point
+    that sits between two "plain" characters and is not inside a **Heading**,
+    or inside one that is still open and may yet be closed. No rule can match
+    across such a point, so the text before it formats the same on its own as
+    it would as part of the whole reply. A heading never spans a line break
+    or more than HEADING_MAX_CHARS characters, so an unclosed "**" holds back
+    at most that much.
+
+    Complete headings are found once, as text arrives, and remembered until
+    their text is released; each feed() only looks at the new text and the
+    last HEADING_SPAN characters.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._started = False
+        # (start, end) of the complete headings in _buf, in order
+        self._headings: List[Tuple[int, int]] = []
+        # Where the search for more headings resumes: no heading can start
+        # before it that is not in _headings already
+        self._scan = 0
+
+    def _find_headings(self) -> None:
+        buf = self._buf
+        for m in HEADING_RE.finditer(buf, self._scan):
+            self._headings.append(m.span())
+            self._scan = m.end()
+        # A heading starting further back would have been closed by now
+        self._scan = max(self._scan, len(buf) - HEADING_SPAN)
+
+    def _split_point(self) -> int:
+        buf = self._buf
+        headings = self._headings
+        i = len(headings)
+        p = len(buf) - 1
+        while p > 0:
+            if not (_is_plain(buf[p - 1]) and _is_plain(buf[p])):
+                p -= 1
+                continue
+            while i and headings[i - 1][0] >= p:
+                i -= 1
+            last_end = 0
+            if i:
+                start, last_end = headings[i - 1]
+                if last_end > p:
+                    # Inside a complete heading: split before it
+                    p = start
+                    continue
+            # A heading opened before p can only be closed after p if it
+            # started within the last HEADING_SPAN characters
+            open_heading = OPEN_HEADING_RE.search(buf, max(last_end, p - HEADING_SPAN), p)
+            if open_heading is None:
+                return p
+            # A heading is still open: we can only split before it
+            p = open_heading.start()
+        return 0
+
+    def feed(self, piece: str) -> str:
+        """Add the next piece of the reply; return newly finalized text."""
+        if not piece:
+            return ""
+        self._buf += piece
+        self._find_headings()
+
+        p = self._split_point()
+        if p == 0:
+            return ""
+
+        out = _normalize(self._buf[:p])
+        self._buf = self._buf[p:]
+        self._headings = [(a - p, b - p) for a, b in self._headings if a >= p]
+        self._scan = max(self._scan - p, 0)
+        if not self._started:
+            out = out.lstrip()
+            self._started = True
+        return out
+
+    def flush(self) -> str:
+        """Format whatever is left at the end of the stream."""
+        out = _normalize(self._buf) if self._buf else ""
+        self._buf = ""
+        self._headings = []
+        self._scan = 0
+        if self._started:
+            return out.rstrip()
+        self._started = True
+        return out.strip()
@@ -1,14 +1,21 @@
+import hashlib
 import os
 import sys
+import time
 from collections import defaultdict
+from typing import List
 
 import ollama
 
 parent_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 sys.path.insert(0, parent_dir)
 
+from settings import CHAT_MODEL, OLLAMA_KEEP_ALIVE
+from metrics import LLM_TOKENS, OLLAMA_ERRORS, record, span
+from ollama_api.ollama_client import OllamaOverloaded, OllamaService
 
-MODEL = "llama3.1:8b"
+
+MODEL = CHAT_MODEL
 
 BASE_SYSTEM_PROMPT = """
 You are Duke, an HR assistant for a group of employees.
@@ -52,11 +59,17 @@ Do not try to fill in missing pieces with assumptions.
 """.strip()
 
 
-def build_prompt(database_context: str, user_query: str) -> str:
-    """Build the full prompt given DB context + user question."""
-    return f"""{BASE_SYSTEM_PROMPT}
+# Part of the answer cache key: changing the prompt text (or bumping the "v2"
+# when build_messages' layout changes) invalidates every cached answer
+PROMPT_VERSION = "v2-" + hashlib.sha256(BASE_SYSTEM_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+# Reply returned when the Ollama call fails (never cached)
+ERROR_REPLY = "Error querying Ollama."
+
 
-Database context:
+def build_prompt(database_context: str, user_query: str) -> str:
+    """Build the user message given DB context + user question."""
+    return f"""Database context:
 {database_context}
 
 User query:
@@ -64,19 +77,127 @@ User query:
 """
 
 
+def build_messages(database_context: str, user_query: str) -> List[dict]:
+    """
+    Chat messages for one question.
+
+    The fixed instructions go in their own system message, first, so every
+    request starts with the same tokens and Ollama can reuse the cached
+    prefix instead of evaluating the system prompt again.
+    """
+    return [
+        {"role": "system", "content": BASE_SYSTEM_PROMPT},
+        {"role": "user", "content": build_prompt(database_context, user_query)},
+    ]
+
+
+def ollama_failed(op: str, e: Exception) -> None:
+    """Count and log a failed Ollama call (the caller decides what to return)."""
+    OLLAMA_ERRORS.inc(op=op, error=type(e).__name__)
+    print(f"❌ Ollama {op} failed: {e!r}")
+
+
+def record_eval_stats(response) -> None:
+    """Add prompt/completion token counts from Ollama's eval stats to metrics."""
+    prompt_tokens = response.get("prompt_eval_count") or 0
+    completion_tokens = response.get("eval_count") or 0
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind="completion")
+
+
 def query_ollama(database_context: str, user_query: str) -> str:
     """Call Ollama with the HR prompt and return the text reply."""
     if not user_query.strip():
         return "No user query provided."
 
-    prompt = build_prompt(database_context, user_query)
+    messages = build_messages(database_context, user_query)
 
     try:
         response = ollama.chat(
             model=MODEL,
-            messages=[{"role": "user", "content": prompt}],
+            messages=messages,
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
         
         return response.get("message", {}).get("content", "No response received")
     except Exception as e:
-        return "Error querying Ollama."
+        ollama_failed("chat", e)
+        return ERROR_REPLY
+
+
+async def query_ollama_async(
+    service: OllamaService, database_context: str, user_query: str
+) -> str:
+    """
+    Async version of query_ollama that goes through the shared OllamaService
+    (pooled connections + concurrency gate).
+
+    OllamaOverloaded is re-raised so the API can answer 429/503.
+    """
+    if not user_query.strip():
+        return "No user query provided."
+
+    with span("prompt"):
+        messages = build_messages(database_context, user_query)
+
+    start = time.perf_counter()
+    try:
+        response = await service.chat(
+            messages=messages,
+            model=MODEL,
+        )
+    except OllamaOverloaded:
+        raise
+    except Exception as e:
+        ollama_failed("chat", e)
+        return ERROR_REPLY
+
+    record("llm_total", time.perf_counter() - start)
+    # Not streamed, so time to first token comes from Ollama's own stats
+    first_token_ns = (response.get("load_duration") or 0) + (response.get("prompt_eval_duration") or 0)
+    if first_token_ns:
+        record("llm_first_token", first_token_ns / 1e9)
+    record_eval_stats(response)
+    return response.get("message", {}).get("content", "No response received")
+
+
+async def stream_ollama_async(
+    service: OllamaService, database_context: str, user_query: str
+):
+    """
+    Streaming version of query_ollama_async: yields the reply text piece by
+    piece as Ollama generates it.
+
+    OllamaOverloaded is re-raised so the API can answer 429/503.
+    """
+    if not user_query.strip():
+        yield "No user query provided."
+        return
+
+    with span("prompt"):
+        messages = build_messages(database_context, user_query)
+
+    start = time.perf_counter()
+    first = True
+    try:
+        async for part in service.chat_stream(
+            messages=messages,
+            model=MODEL,
+        ):
+            content = part.get("message", {}).get("content", "")
+            if part.get("done"):
+                record_eval_stats(part)
+            if content:
+                if first:
+                    record("llm_first_token", time.perf_counter() - start)
+                    first = False
+                yield content
+    except OllamaOverloaded:
+        raise
+    except Exception as e:
+        ollama_failed("chat", e)
+        yield ERROR_REPLY
+        return
+    record("llm_total", time.perf_counter() - start)
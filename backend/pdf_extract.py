@@ -0,0 +1,183 @@
+"""
+PDF text extraction for build_index.py.
+
+Pages are extracted in a process pool, in ranges of a few pages per task, so
+big PDFs are spread over all cores and a worker only ever holds one page
+range in memory. extract_pdfs() hands the pages back in document order as
+they finish, and only a few ranges run ahead of the consumer, so the build
+never holds a whole document's text at once.
+
+Backends:
+
+    pypdfium2    fast text extraction with PDFium (the default)
+    pdfplumber   slower layout-based extraction; used when pypdfium2 is not
+                 installed or cannot read a file
+
+Both are pure pip installs; pypdfium2 comes with pdfplumber.
+"""
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # pdfplumber only
+    pdfium = None
+
+BACKENDS = ("auto", "pypdfium2", "pdfplumber")
+
+# Pages per extraction task
+PAGES_PER_TASK = 16
+
+# (1-based page number, page text)
+Page = Tuple[int, str]
+
+
+def _clean(text: str) -> str:
+    # PDFium ends lines with \r\n; keep "\n" like pdfplumber
+    return text.replace("\r\n", "\n").replace("\r", "\n").strip("\x00")
+
+
+def _pdfium_pages(path: str, start: int, stop: int) -> List[Page]:
+    pdf = pdfium.PdfDocument(path)
+    try:
+        out = []
+        for i in range(start, min(stop, len(pdf))):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            try:
+                out.append((i + 1, _clean(textpage.get_text_bounded())))
+            finally:
+                textpage.close()
+                page.close()
+        return out
+    finally:
+        pdf.close()
+
+
+def _pdfplumber_pages(path: str, start: int, stop: int) -> List[Page]:
+    import pdfplumber
+
+    with pdfplumber.open(path, pages=list(range(start + 1, stop + 1))) as pdf:
+        out = []
+        for page in pdf.pages:
+            # May be None if the page is image-only
+            out.append((page.page_number, page.extract_text() or ""))
+            page.close()
+        return out
+
+
+def page_count(path: str, backend: str = "auto") -> int:
+    """Number of pages in a PDF."""
+    if backend != "pdfplumber" and pdfium is not None:
+        try:
+            pdf = pdfium.PdfDocument(path)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+        except pdfium.PdfiumError:
+            if backend == "pypdfium2":
+                raise
+    import pdfplumber
+
+    with pdfplumber.open(path) as pdf:
+        return len(pdf.pages)
+
+
+def extract_pages(path: str, start: int, stop: int, backend: str = "auto") -> List[Page]:
+    """
+    Extract the text of pages [start, stop) (0-based) of a PDF.
+
+    Args:
+        path: Path to the PDF file on disk.
+        start, stop: Page range.
+        backend: "pypdfium2", "pdfplumber", or "auto" (pypdfium2, falling
+                 back to pdfplumber if it is missing or fails on the file).
+
+    Returns:
+        (page number, text) for every page in the range; image-only pages
+        have empty text.
+    """
+    if backend == "pdfplumber" or (backend == "auto" and pdfium is None):
+        return _pdfplumber_pages(path, start, stop)
+    if pdfium is None:
+        raise RuntimeError("pypdfium2 is not installed (pip install pypdfium2)")
+    try:
+        return _pdfium_pages(path, start, stop)
+    except pdfium.PdfiumError as e:
+        if backend == "pypdfium2":
+            raise
+        print(f"  ⚠ pypdfium2 failed on {path} ({e}), using pdfplumber")
+        return _pdfplumber_pages(path, start, stop)
+
+
+def _serial_pdfs(
+    paths: Sequence[str], pages_per_task: int, backend: str
+) -> Iterator[Tuple[str, Iterator[Page]]]:
+    def pages(path: str) -> Iterator[Page]:
+        n = page_count(path, backend)
+        for start in range(0, n, pages_per_task):
+            yield from extract_pages(path, start, start + pages_per_task, backend)
+
+    for path in paths:
+        yield path, pages(path)
+
+
+def extract_pdfs(
+    paths: Sequence[str],
+    workers: Optional[int] = None,
+    pages_per_task: int = PAGES_PER_TASK,
+    backend: str = "auto",
+) -> Iterator[Tuple[str, Iterator[Page]]]:
+    """
+    Extract the pages of many PDFs in a process pool.
+
+    Yields (path, pages) for every path, in order, where pages yields the
+    (page number, text) of that file in page order. Consume each file's
+    pages before asking for the next file (leftover pages are skipped).
+
+    Args:
+        paths: PDF files.
+        workers: Extraction processes (None = one per CPU, 0 = extract in
+                 this process, one range at a time).
+        pages_per_task: Pages extracted per task; also the unit of lookahead.
+        backend: See extract_pages().
+    """
+    if workers == 0:
+        yield from _serial_pdfs(paths, pages_per_task, backend)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        counts = list(pool.map(page_count, paths, [backend] * len(paths)))
+        tasks = deque(
+            (path, start)
+            for path, n in zip(paths, counts)
+            for start in range(0, n, pages_per_task)
+        )
+        # Ranges submitted but not yet consumed, in order; bounded, so
+        # extraction never runs far ahead of chunking and embedding
+        running: Deque[Future] = deque()
+
+        def fill() -> None:
+            while tasks and len(running) < 2 * workers:
+                path, start = tasks.popleft()
+                running.append(pool.submit(
+                    extract_pages, path, start, start + pages_per_task, backend
+                ))
+
+        def pages(left: List[int]) -> Iterator[Page]:
+            while left[0]:
+                left[0] -= 1
+                fut = running.popleft()
+                fill()
+                yield from fut.result()
+
+        fill()
+        for path, n in zip(paths, counts):
+            left = [-(-n // pages_per_task)]
+            yield path, pages(left)
+            for _ in pages(left):
+                pass
@@ -0,0 +1,111 @@
+"""
+Quantized copies of the embedding matrix for faster, smaller scans.
+
+The float32 embeddings.npy stays the source of truth. Next to it the builder
+can store a float16 or an int8 copy; the search engine scans the small copy
+and re-scores a shortlist against float32 rows, so only those rows of the
+big matrix are ever paged in.
+
+Stored next to the index files of a generation:
+
+    emb_float16.npy     (n, dim) float16
+    emb_int8.npy        (n, dim) int8, row value = round(x / scale)
+    emb_int8_scale.npy  (dim,) float32, per-dimension scale (max |x| / 127)
+
+NumPy has no float16 / int8 BLAS, so rows are widened to float32 in small
+blocks that stay in cache. For int8 that is cheaper than streaming the 4x
+larger float32 matrix; float16 widening is slow in NumPy, so float16 mostly
+saves memory rather than time.
+"""
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+FLOAT16 = "emb_float16"
+INT8 = "emb_int8"
+INT8_SCALE = "emb_int8_scale"
+
+KINDS = ("none", "float16", "int8")
+
+# Rows widened to float32 per block while scoring (256 x 768 floats = 768 KB,
+# small enough to stay in L2)
+_BLOCK = 256
+
+
+def quantize_embeddings(embs: np.ndarray, kind: str) -> Dict[str, np.ndarray]:
+    """
+    Quantize unit-length embeddings.
+
+    Args:
+        embs: (n, dim) float32 matrix with L2-normalized rows.
+        kind: "none", "float16" or "int8".
+
+    Returns:
+        The arrays to store with the index (see index_store.publish_index);
+        empty for "none".
+    """
+    if kind not in KINDS:
+        raise ValueError(f"quantization must be one of {KINDS}, got {kind!r}")
+    if kind == "none" or not embs.size:
+        return {}
+    embs = np.asarray(embs, dtype=np.float32)
+    if kind == "float16":
+        return {FLOAT16: embs.astype(np.float16)}
+
+    scale = np.abs(embs).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(embs / scale), -127, 127).astype(np.int8)
+    return {INT8: q, INT8_SCALE: scale.astype(np.float32)}
+
+
+class QuantizedMatrix:
+    """
+    Read side of a quantized embedding matrix.
+
+    Args:
+        kind: "float16" or "int8".
+        data: The quantized (n, dim) matrix.
+        scale: Per-dimension scale (int8 only).
+    """
+
+    def __init__(self, kind: str, data: np.ndarray, scale: Optional[np.ndarray] = None):
+        self.kind = kind
+        self.data = data
+        self.scale = scale
+        # One float32 block buffer per thread, reused across queries
+        self._local = threading.local()
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, Optional[np.ndarray]]) -> Optional["QuantizedMatrix"]:
+        """Build from stored arrays; None if the index has no quantized copy."""
+        if arrays.get(INT8) is not None and arrays.get(INT8_SCALE) is not None:
+            return cls("int8", arrays[INT8], arrays[INT8_SCALE])
+        if arrays.get(FLOAT16) is not None:
+            return cls("float16", arrays[FLOAT16])
+        return None
+
+    def score(self, rows, q: np.ndarray, out: np.ndarray) -> None:
+        """
+        Approximate dot products of q with the given rows, written into out.
+
+        Args:
+            rows: A slice or an array of row numbers.
+            q: Unit-length float32 query (dim,), or several as columns
+               (dim, n_queries).
+            out: float32 buffer with one slot (row) per selected row.
+        """
+        data = self.data[rows]
+        if self.kind == "int8":
+            # Fold the per-dimension scale into the query: x.q = r.(scale*q)
+            q = q * (self.scale if q.ndim == 1 else self.scale[:, None])
+
+        buf = getattr(self._local, "block", None)
+        if buf is None:
+            buf = np.empty((_BLOCK, self.data.shape[1]), dtype=np.float32)
+            self._local.block = buf
+        for start in range(0, data.shape[0], _BLOCK):
+            part = data[start:start + _BLOCK]
+            block = buf[:len(part)]
+            block[...] = part
+            np.matmul(block, q, out=out[start:start + len(part)])
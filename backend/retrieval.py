@@ -0,0 +1,408 @@
+"""
+Cosine-similarity search over a ChunkIndex.
+
+All the work that does not depend on the query happens once, when the engine
+is built: rows are L2-normalized and chunks are grouped by doc_id. A query is
+then a single matrix-vector product over the rows it is allowed to see,
+followed by an argpartition to pick the top-k.
+
+If the index was built with an IVF index (see ann.py) and the engine is given
+an nprobe, queries only score the chunks in the closest inverted lists.
+
+If it was built with a quantized copy of the embeddings (see quantize.py) and
+the engine is given a rescore factor, the scan runs over the small float16 /
+int8 matrix and only a shortlist of top_k * rescore rows is re-scored against
+the float32 rows.
+
+If it was built with a BM25 index (see lexical.py), lexical_search() ranks
+chunks by exact terms, and reciprocal_rank_fusion() merges that ranking with
+the dense one.
+"""
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ann import IVFIndex, CENTROIDS, OFFSETS, ROWS
+from index_store import ChunkIndex
+from lexical import ARRAYS as BM25_ARRAYS, BM25Index
+from quantize import FLOAT16, INT8, INT8_SCALE, QuantizedMatrix
+
+# Scores per block when top_k_indices() selects from long score arrays
+TOP_K_BLOCK = 16384
+
+
+class RetrievalEngine:
+    """
+    Cosine search with a doc_id filter, exact or over an IVF index.
+
+    Args:
+        index: The loaded ChunkIndex to search over.
+        nprobe: Inverted lists to scan per query. 0 (or an index without IVF
+                data) means exact brute-force search.
+        rescore: Scan the quantized embeddings and re-score top_k * rescore
+                 rows in float32. 0 (or an index without a quantized copy)
+                 means scanning the float32 rows directly.
+    """
+
+    def __init__(self, index: ChunkIndex, nprobe: int = 0, rescore: int = 0):
+        self.index = index
+
+        embs = index.embeddings
+        if not index.meta.get("normalized"):
+            # Older indexes were written with raw vectors: normalize them once
+            # here (this makes a private copy, rebuilding the index avoids it)
+            embs = np.asarray(embs, dtype=np.float32)
+            norms = np.linalg.norm(embs, axis=1, keepdims=True)
+            embs = embs / (norms + 1e-10)
+        self.embs = embs
+
+        # Group rows by doc_id. Each doc gets its row numbers, and, when those
+        # rows are contiguous (the normal case for build_index.py output), a
+        # (start, end) span so we can score a view without copying.
+        rows_by_doc: Dict[str, List[int]] = {}
+        for i, d in enumerate(index.doc_ids):
+            rows_by_doc.setdefault(d, []).append(i)
+
+        self._doc_rows: Dict[str, np.ndarray] = {}
+        self._doc_span: Dict[str, Tuple[int, int]] = {}
+        for d, rows in rows_by_doc.items():
+            arr = np.asarray(rows, dtype=np.int64)
+            self._doc_rows[d] = arr
+            if rows[-1] - rows[0] + 1 == len(rows):
+                self._doc_span[d] = (rows[0], rows[-1] + 1)
+
+        # doc number per row, so IVF / BM25 candidates can be filtered by doc_id
+        self._doc_code: Dict[str, int] = {d: c for c, d in enumerate(rows_by_doc)}
+        self._row_doc = np.asarray(
+            [self._doc_code[d] for d in index.doc_ids], dtype=np.int32
+        )
+
+        # IVF index, if the build stored one and approximate search is on
+        self.ivf: Optional[IVFIndex] = None
+        self.nprobe = nprobe
+        if nprobe > 0:
+            self.ivf = IVFIndex.from_arrays(
+                {name: index.array(name) for name in (CENTROIDS, ROWS, OFFSETS)}
+            )
+
+        # BM25 index, if the build stored one
+        self.bm25 = BM25Index.from_arrays(
+            {name: index.array(name) for name in BM25_ARRAYS}
+        )
+
+        # Quantized copy of the embeddings, if the build stored one
+        self.quant: Optional[QuantizedMatrix] = None
+        self.rescore = rescore
+        if rescore > 0 and index.meta.get("normalized"):
+            self.quant = QuantizedMatrix.from_arrays(
+                {name: index.array(name) for name in (FLOAT16, INT8, INT8_SCALE)}
+            )
+
+        # One score buffer per thread, reused across queries
+        self._local = threading.local()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def mode(self) -> str:
+        """
+        "exact" or "ivf", plus "+float16" / "+int8" if the scan runs over
+        quantized embeddings.
+        """
+        mode = "ivf" if self.ivf is not None else "exact"
+        if self.quant is not None:
+            mode += "+" + self.quant.kind
+        return mode
+
+    def _scores_buffer(self, n: int) -> np.ndarray:
+        buf = getattr(self._local, "scores", None)
+        if buf is None or buf.shape[0] < n:
+            buf = np.empty(max(n, len(self.index)), dtype=np.float32)
+            self._local.scores = buf
+        return buf[:n]
+
+    def _score(self, rows, q: np.ndarray, out: np.ndarray) -> None:
+        """Scores of the given rows (slice or row numbers) into out."""
+        if self.quant is not None:
+            self.quant.score(rows, q, out)
+        else:
+            np.matmul(self.embs[rows], q, out=out)
+
+    def _top(
+        self,
+        scores: np.ndarray,
+        row_ids: Optional[np.ndarray],
+        q: np.ndarray,
+        top_k: int,
+    ) -> List[Tuple[int, float]]:
+        """
+        Pick the top_k hits from a score buffer.
+
+        Args:
+            scores: One score per candidate.
+            row_ids: Row number of every candidate (None = candidate i is row i).
+            q: The normalized query, for re-scoring.
+            top_k: How many results to return.
+        """
+        if self.quant is None:
+            top = top_k_indices(scores, top_k)
+            rows = top if row_ids is None else row_ids[top]
+            return [(int(r), float(scores[i])) for r, i in zip(rows, top)]
+
+        # Quantized scores only choose the shortlist; the float32 rows decide
+        short = top_k_indices(scores, top_k * self.rescore)
+        rows = np.sort(short if row_ids is None else row_ids[short])
+        exact = self.embs[rows] @ q
+        top = top_k_indices(exact, top_k)
+        return [(int(rows[i]), float(exact[i])) for i in top]
+
+    def _normalize_query(self, q_emb) -> np.ndarray:
+        q = np.asarray(q_emb, dtype=np.float32).ravel()
+        return q / (np.linalg.norm(q) + 1e-10)
+
+    def search(
+        self,
+        q_emb,
+        top_k: int = 4,
+        doc_ids: Optional[Sequence[str]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Find the rows most similar to a query embedding.
+
+        Args:
+            q_emb: The query embedding (any float array-like).
+            top_k: How many results to return.
+            doc_ids: If given, only search chunks from these docs.
+
+        Returns:
+            A list of (row, cosine_similarity), best first.
+        """
+        if top_k <= 0 or len(self.index) == 0:
+            return []
+
+        q = self._normalize_query(q_emb)
+
+        docs = None
+        if doc_ids:
+            docs = [d for d in dict.fromkeys(doc_ids) if d in self._doc_rows]
+            if not docs:
+                return []
+
+        if self.ivf is not None:
+            hits = self._search_ivf(q, top_k, docs)
+            if hits is not None:
+                return hits
+
+        n = sum(len(self._doc_rows[d]) for d in docs) if docs else len(self.index)
+        scores, row_ids = self._score_docs(q, docs, self._scores_buffer(n))
+        return self._top(scores, row_ids, q, top_k)
+
+    def search_batch(
+        self,
+        q_embs,
+        top_k: int = 4,
+        doc_ids: Optional[Sequence[str]] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        search() for several queries with the same top_k and doc filter.
+
+        Exact search scores all of them with one matrix-matrix product, which
+        BLAS runs much faster than one matrix-vector product per query. IVF
+        candidates differ per query, so IVF search runs query by query.
+
+        Args:
+            q_embs: (n_queries, dim) query embeddings.
+            top_k, doc_ids: As for search().
+
+        Returns:
+            One search() result per query, in order.
+        """
+        q_embs = np.asarray(q_embs, dtype=np.float32)
+        if len(q_embs) <= 1 or self.ivf is not None:
+            return [self.search(q, top_k, doc_ids) for q in q_embs]
+        if top_k <= 0 or len(self.index) == 0:
+            return [[] for _ in q_embs]
+
+        qs = q_embs / (np.linalg.norm(q_embs, axis=1, keepdims=True) + 1e-10)
+
+        docs = None
+        if doc_ids:
+            docs = [d for d in dict.fromkeys(doc_ids) if d in self._doc_rows]
+            if not docs:
+                return [[] for _ in q_embs]
+
+        # One column of scores per query
+        n = sum(len(self._doc_rows[d]) for d in docs) if docs else len(self.index)
+        scores, row_ids = self._score_docs(
+            np.ascontiguousarray(qs.T), docs, np.empty((n, len(qs)), dtype=np.float32)
+        )
+        scores = np.ascontiguousarray(scores.T)
+        return [self._top(scores[j], row_ids, qs[j], top_k) for j in range(len(qs))]
+
+    def _score_docs(
+        self,
+        q: np.ndarray,
+        docs: Optional[List[str]],
+        scores: np.ndarray,
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        Score the rows of the given docs (all rows if docs is None) into the
+        scores buffer.
+
+        Args:
+            q: One query (dim,) or several as columns (dim, n_queries).
+            docs: Known doc_ids to search, or None.
+            scores: Buffer with one row per selected chunk.
+
+        Returns:
+            (scores, row_ids); row_ids is None when every row was scored.
+        """
+        if not docs:
+            self._score(slice(None), q, scores)
+            return scores, None
+
+        # Score each selected doc into its own slice of the buffer
+        pos = 0
+        for d in docs:
+            rows = self._doc_rows[d]
+            out = scores[pos:pos + len(rows)]
+            span = self._doc_span.get(d)
+            self._score(slice(*span) if span is not None else rows, q, out)
+            pos += len(rows)
+
+        if len(docs) == 1:
+            return scores, self._doc_rows[docs[0]]
+        return scores, np.concatenate([self._doc_rows[d] for d in docs])
+
+    def lexical_search(
+        self,
+        query: str,
+        top_k: int = 4,
+        doc_ids: Optional[Sequence[str]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Rank chunks by BM25 over the query's terms. Needs no embedding.
+
+        Args:
+            query: The raw query text.
+            top_k: How many results to return.
+            doc_ids: If given, only search chunks from these docs.
+
+        Returns:
+            A list of (row, bm25_score), best first; empty if the index has
+            no BM25 data or no chunk contains a query term.
+        """
+        if self.bm25 is None or top_k <= 0:
+            return []
+
+        rows, scores = self.bm25.score(query)
+        if doc_ids:
+            allowed = [self._doc_code[d] for d in dict.fromkeys(doc_ids) if d in self._doc_code]
+            keep = np.isin(self._row_doc[rows], np.asarray(allowed, dtype=np.int32))
+            rows, scores = rows[keep], scores[keep]
+
+        top = top_k_indices(scores, top_k)
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def _search_ivf(
+        self,
+        q: np.ndarray,
+        top_k: int,
+        docs: Optional[List[str]],
+    ) -> Optional[List[Tuple[int, float]]]:
+        """
+        Approximate search over the nprobe closest IVF lists.
+
+        With a doc filter, nprobe is scaled up by the share of rows the filter
+        allows, so about as many candidates survive as for an unfiltered query
+        (and recall stays about the same).
+
+        Returns None when exact search is the better choice: the filter allows
+        fewer rows than the probed lists would hold, or too few candidates
+        survive the filter to fill top_k.
+        """
+        ivf = self.ivf
+        nprobe = self.nprobe
+        if docs:
+            n_allowed = sum(len(self._doc_rows[d]) for d in docs)
+            nprobe = int(np.ceil(nprobe * len(self.index) / n_allowed))
+            expected = len(self.index) * min(nprobe, ivf.n_lists) / ivf.n_lists
+            if nprobe >= ivf.n_lists or n_allowed <= expected:
+                return None
+
+        cand = ivf.candidates(q, nprobe)
+        if docs:
+            allowed = np.asarray([self._doc_code[d] for d in docs], dtype=np.int32)
+            cand = cand[np.isin(self._row_doc[cand], allowed)]
+        if len(cand) < top_k:
+            return None
+
+        # Candidates come list by list; sorting them keeps the gather sequential
+        cand.sort()
+        scores = self._scores_buffer(len(cand))
+        self._score(cand, q, scores)
+        return self._top(scores, cand, q, top_k)
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[Tuple[int, float]]],
+    top_k: int,
+    k: int = 60,
+) -> List[Tuple[int, float]]:
+    """
+    Merge several rankings with reciprocal rank fusion.
+
+    Every row gets sum(1 / (k + rank)) over the rankings it appears in, so
+    only ranks matter and BM25 / cosine scores need no calibration.
+
+    Args:
+        rankings: Lists of (row, score), best first.
+        top_k: How many results to return.
+        k: RRF damping constant (60 in the original paper).
+
+    Returns:
+        A list of (row, fused_score), best first.
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (row, _) in enumerate(ranking, start=1):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Positions of the k largest scores, best first.
+
+    Uses argpartition so the cost is O(n + k log k) instead of a full sort.
+    Long score arrays are read block by block: the first block gives a
+    running set of the k best, and later blocks only add the scores that
+    reach its k-th best. Temporary arrays are O(TOP_K_BLOCK + k), never
+    O(n) (argpartition of the whole buffer would allocate n indices, twice
+    the size of the float32 scores). Only k >= n returns, and so allocates,
+    all n positions.
+    """
+    n = scores.shape[0]
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(scores)[::-1]
+
+    m = min(n, max(TOP_K_BLOCK, k))
+    first = scores[:m]
+    best_pos = np.argpartition(first, m - k)[m - k:] if m > k else np.arange(m)
+    best_val = first[best_pos]
+    for start in range(m, n, TOP_K_BLOCK):
+        block = scores[start:start + TOP_K_BLOCK]
+        new = np.flatnonzero(block >= best_val.min())
+        if not len(new):
+            continue
+        pos = np.concatenate([best_pos, new + start])
+        val = np.concatenate([best_val, block[new]])
+        if len(pos) > k:
+            keep = np.argpartition(val, len(val) - k)[len(val) - k:]
+            pos, val = pos[keep], val[keep]
+        best_pos, best_val = pos, val
+    return best_pos[np.argsort(best_val)[::-1]]
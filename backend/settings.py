@@ -0,0 +1,121 @@
+"""
+Runtime settings for the HR backend.
+
+Every value can be overridden with an environment variable of the same name,
+e.g. `OLLAMA_URL=http://gpu-box:11434 uvicorn main:app`.
+"""
+import os
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.getenv(name, default))
+
+
+def _env_keep_alive(name: str, default: str):
+    """Ollama keep_alive: seconds as a number, a duration string, or None."""
+    value = os.getenv(name, default).strip()
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+
+# ---- Ollama ----
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.1:8b")
+
+# ---- Index ----
+INDEX_DIR = os.getenv("INDEX_DIR", "data/index")
+# Seconds between checks for a newly published index generation (0 = off;
+# POST /admin/reload always works)
+INDEX_WATCH_INTERVAL = _env_float("INDEX_WATCH_INTERVAL", 5.0)
+# "exact" = brute-force cosine search; "ivf" = approximate search over the
+# IVF index stored by build_index.py (falls back to exact if there is none)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "exact")
+# Inverted lists scanned per query in "ivf" mode: higher = better recall,
+# slower queries. Use bench_ann.py to pick a value for your corpus.
+IVF_NPROBE = _env_int("IVF_NPROBE", 8)
+# If the index has a float16 / int8 copy of the embeddings (build_index.py
+# --quantize), scan that and re-score top_k * SEARCH_RESCORE rows in float32
+# (0 = always scan the float32 matrix). Use bench_quant.py to check recall.
+SEARCH_RESCORE = _env_int("SEARCH_RESCORE", 8)
+# "dense" = embedding search only; "hybrid" = fuse embedding and BM25
+# rankings (reciprocal rank fusion); "lexical" = BM25 only, no embedding call.
+# Indexes built without BM25 data always use "dense".
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusing them
+HYBRID_DEPTH = _env_int("HYBRID_DEPTH", 20)
+# In "hybrid" mode, answer from BM25 alone if the query embedding takes longer
+# than this (seconds; 0 = wait) or the embedding service is down
+EMBED_FALLBACK_TIMEOUT = _env_float("EMBED_FALLBACK_TIMEOUT", 2.0)
+# If set, /admin/* endpoints require this value in the X-Admin-Token header
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# ---- Observability ----
+# Log requests slower than this many seconds, with their stage timings and
+# retrieved chunk ids (0 = off). Timings are also on GET /metrics.
+SLOW_REQUEST_SECONDS = _env_float("SLOW_REQUEST_SECONDS", 0.0)
+
+# ---- Prompt ----
+# Token budget for the database context sent to the chat model (estimated
+# from characters; 0 = no limit). Neighbouring retrieved chunks are merged
+# first, so their overlap is not sent twice (see context.py).
+CONTEXT_MAX_TOKENS = _env_int("CONTEXT_MAX_TOKENS", 1500)
+# How long Ollama keeps the models loaded after a request: a duration like
+# "30m", seconds, or a negative value for forever ("" = Ollama's default).
+# A resident chat model also keeps the cached system prompt prefix.
+OLLAMA_KEEP_ALIVE = _env_keep_alive("OLLAMA_KEEP_ALIVE", "-1")
+
+# ---- Startup / readiness ----
+# Load both models with a warm-up call at startup; GET /readyz fails until
+# they (and the index) are loaded (0 = no warm-up, /readyz only checks the index)
+MODEL_WARMUP = _env_int("MODEL_WARMUP", 1)
+# Seconds between checks that Ollama still has the models loaded; evicted
+# models are warmed up again, and /readyz fails meanwhile (0 = no checks)
+MODEL_CHECK_INTERVAL = _env_float("MODEL_CHECK_INTERVAL", 30.0)
+
+# ---- Timeouts (seconds) ----
+OLLAMA_CONNECT_TIMEOUT = _env_float("OLLAMA_CONNECT_TIMEOUT", 5.0)
+EMBED_TIMEOUT = _env_float("EMBED_TIMEOUT", 30.0)
+CHAT_TIMEOUT = _env_float("CHAT_TIMEOUT", 300.0)
+
+# ---- Connection pool shared by all Ollama calls ----
+OLLAMA_MAX_CONNECTIONS = _env_int("OLLAMA_MAX_CONNECTIONS", 32)
+OLLAMA_MAX_KEEPALIVE = _env_int("OLLAMA_MAX_KEEPALIVE", 16)
+
+# ---- Concurrency limits in front of Ollama ----
+# *_MAX_CONCURRENT requests run at once, up to *_MAX_WAITING more queue up
+# behind them; anything beyond that gets a 429 straight away. A queued request
+# that waits longer than QUEUE_WAIT_TIMEOUT gets a 503.
+EMBED_MAX_CONCURRENT = _env_int("EMBED_MAX_CONCURRENT", 8)
+EMBED_MAX_WAITING = _env_int("EMBED_MAX_WAITING", 64)
+CHAT_MAX_CONCURRENT = _env_int("CHAT_MAX_CONCURRENT", 2)
+CHAT_MAX_WAITING = _env_int("CHAT_MAX_WAITING", 16)
+QUEUE_WAIT_TIMEOUT = _env_float("QUEUE_WAIT_TIMEOUT", 30.0)
+
+# ---- Micro-batching (see batching.py) ----
+# Query embeddings that arrive within EMBED_BATCH_WINDOW_MS of each other go
+# to Ollama as one /api/embed call of up to EMBED_BATCH_MAX texts; dense
+# searches with the same filter are scored as one matrix-matrix product the
+# same way. A lone request waits at most one window (0 = no batching).
+EMBED_BATCH_WINDOW_MS = _env_float("EMBED_BATCH_WINDOW_MS", 2.0)
+EMBED_BATCH_MAX = _env_int("EMBED_BATCH_MAX", 32)
+SEARCH_BATCH_WINDOW_MS = _env_float("SEARCH_BATCH_WINDOW_MS", 1.0)
+SEARCH_BATCH_MAX = _env_int("SEARCH_BATCH_MAX", 16)
+
+# ---- Caches ----
+# Query embeddings, keyed on the normalized message text
+EMBED_CACHE_MAX_ENTRIES = _env_int("EMBED_CACHE_MAX_ENTRIES", 10_000)
+EMBED_CACHE_MAX_BYTES = _env_int("EMBED_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+EMBED_CACHE_TTL = _env_float("EMBED_CACHE_TTL", 24 * 3600.0)
+# Final answers, keyed on message + docs + retrieved chunks + model + prompt
+ANSWER_CACHE_MAX_ENTRIES = _env_int("ANSWER_CACHE_MAX_ENTRIES", 2_000)
+ANSWER_CACHE_MAX_BYTES = _env_int("ANSWER_CACHE_MAX_BYTES", 32 * 1024 * 1024)
+ANSWER_CACHE_TTL = _env_float("ANSWER_CACHE_TTL", 3600.0)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The backend modules are imported as top-level modules (run from backend/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
@@ -0,0 +1,67 @@
+import asyncio
+
+from batching import MicroBatcher
+from ollama_api.ollama_client import ConcurrencyGate, OllamaOverloaded
+
+
+def test_results_go_back_to_their_callers():
+    calls = []
+
+    async def run_batch(key, items):
+        calls.append((key, list(items)))
+        return [key + str(x) for x in items]
+
+    async def run():
+        batcher = MicroBatcher("test", run_batch, max_batch=4, window=0.01)
+        return await asyncio.gather(
+            *(batcher.submit(i, key="a" if i % 2 else "b") for i in range(6))
+        )
+
+    assert asyncio.run(run()) == ["b0", "a1", "b2", "a3", "b4", "a5"]
+    # Only calls with the same key share a batch
+    assert sorted(calls) == [("a", [1, 3, 5]), ("b", [0, 2, 4])]
+
+
+def test_full_batch_runs_without_waiting_for_the_window():
+    async def run():
+        batcher = MicroBatcher("test", lambda key, items: asyncio.sleep(0, items), 2, window=10)
+        return await asyncio.wait_for(asyncio.gather(batcher.submit(1), batcher.submit(2)), 1)
+
+    assert asyncio.run(run()) == [1, 2]
+
+
+def test_failure_reaches_every_caller():
+    async def run_batch(key, items):
+        raise ValueError("boom")
+
+    async def run():
+        batcher = MicroBatcher("test", run_batch, max_batch=8, window=0.01)
+        return await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_batched_callers_are_still_limited_by_the_gate():
+    # A batch resumes all its callers in the same tick; the gate must still
+    # turn the excess into 429s
+    async def run():
+        gate = ConcurrencyGate("chat", max_concurrent=2, max_waiting=1, wait_timeout=30)
+        batcher = MicroBatcher("test", lambda key, items: asyncio.sleep(0, items), 16, 0.01)
+
+        async def request(i):
+            await batcher.submit(i)
+            try:
+                async with gate.slot():
+                    await asyncio.sleep(0.05)
+                return "ok"
+            except OllamaOverloaded as e:
+                return str(e.status_code)
+
+        return await asyncio.gather(*(request(i) for i in range(8)))
+
+    results = asyncio.run(run())
+    assert results.count("ok") == 3
+    assert results.count("429") == 5
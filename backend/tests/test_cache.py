@@ -0,0 +1,97 @@
+import asyncio
+
+from cache import LRUCache
+
+
+def _cache() -> LRUCache:
+    return LRUCache("test", max_entries=10, max_bytes=1 << 20, ttl=0)
+
+
+def test_get_or_compute_runs_once_for_concurrent_misses():
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "answer"
+
+    async def run():
+        cache = _cache()
+        results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+    assert cache.get("k") == "answer"
+
+
+def test_identical_streams_share_one_generation():
+    starts = []
+
+    async def generate():
+        starts.append(1)
+        for piece in ("a", "b", "c"):
+            await asyncio.sleep(0.01)
+            yield piece
+
+    async def read(cache, delay):
+        await asyncio.sleep(delay)
+        return "".join([p async for p in cache.stream("k", generate)])
+
+    async def run():
+        cache = _cache()
+        # The late reader joins mid-stream and still gets every piece
+        results = await asyncio.gather(read(cache, 0), read(cache, 0), read(cache, 0.015))
+        return cache, results
+
+    cache, results = asyncio.run(run())
+    assert results == ["abc"] * 3
+    assert len(starts) == 1
+    assert cache.shared == 2
+    assert cache.get("k") == "abc"
+
+
+def test_stream_is_cancelled_when_every_reader_leaves():
+    closed = []
+
+    async def generate():
+        try:
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+        finally:
+            closed.append(1)
+
+    async def run():
+        cache = _cache()
+        pieces = cache.stream("k", generate)
+        await pieces.__anext__()
+        await pieces.aclose()
+        await asyncio.sleep(0.05)
+        return cache
+
+    cache = asyncio.run(run())
+    assert closed == [1]
+    assert cache.get("k") is None
+
+
+def test_stream_error_reaches_every_reader_and_is_not_cached():
+    async def generate():
+        await asyncio.sleep(0.01)
+        raise ValueError("overloaded")
+        yield  # pragma: no cover
+
+    async def read(cache):
+        try:
+            return [p async for p in cache.stream("k", generate)]
+        except ValueError as e:
+            return str(e)
+
+    async def run():
+        cache = _cache()
+        return cache, await asyncio.gather(read(cache), read(cache))
+
+    cache, results = asyncio.run(run())
+    assert results == ["overloaded", "overloaded"]
+    assert cache.get("k") is None
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from ollama_api.ollama_client import ConcurrencyGate, OllamaOverloaded
+
+
+async def _call(gate: ConcurrencyGate, hold: float = 0.05) -> str:
+    try:
+        async with gate.slot():
+            await asyncio.sleep(hold)
+        return "ok"
+    except OllamaOverloaded as e:
+        return str(e.status_code)
+
+
+@pytest.mark.parametrize("n", [3, 6, 20])
+def test_same_tick_callers_beyond_queue_are_rejected(n):
+    async def run():
+        gate = ConcurrencyGate("chat", max_concurrent=2, max_waiting=1, wait_timeout=30)
+        return await asyncio.gather(*(_call(gate) for _ in range(n)))
+
+    results = asyncio.run(run())
+    assert results.count("ok") == min(n, 3)
+    assert results.count("429") == max(n - 3, 0)
+
+
+def test_staggered_callers_beyond_queue_are_rejected():
+    async def run():
+        gate = ConcurrencyGate("chat", max_concurrent=2, max_waiting=1, wait_timeout=30)
+
+        async def later(i):
+            await asyncio.sleep(0.01 * i)
+            return await _call(gate, hold=0.2)
+
+        return await asyncio.gather(*(later(i) for i in range(6)))
+
+    results = asyncio.run(run())
+    assert results.count("ok") == 3
+    assert results.count("429") == 3
+
+
+def test_counters_return_to_zero():
+    async def run():
+        gate = ConcurrencyGate("embed", max_concurrent=2, max_waiting=2, wait_timeout=30)
+        await asyncio.gather(*(_call(gate, hold=0.01) for _ in range(8)))
+        return gate
+
+    gate = asyncio.run(run())
+    assert gate.in_flight == 0
+    assert gate.waiting == 0
+
+
+def test_queued_caller_times_out_with_503():
+    async def run():
+        gate = ConcurrencyGate("chat", max_concurrent=1, max_waiting=1, wait_timeout=0.05)
+        return await asyncio.gather(_call(gate, hold=0.3), _call(gate, hold=0.3))
+
+    assert asyncio.run(run()) == ["ok", "503"]
@@ -0,0 +1,47 @@
+import random
+
+from ollama_api.ollama_functions import HEADING_SPAN, StreamingReplyFormatter, format_llm_reply
+
+# Pieces that exercise every rule: headings, bullets, blank lines, spaces
+ATOMS = [
+    "Hello", "world", "policy", ".", ",", " ", "  ", "\n", "\n\n", "\n\n\n",
+    "*", "**", "* ", "• ", "•", "**Summary**", "**Leave Policy**", "**lower**",
+    "**Open", "ing**", "Staff", "\t", "1.", ":", "**Note that",
+    " a rather long stretch of plain words", "\nNext line",
+]
+
+
+def _stream(text: str, rng: random.Random) -> str:
+    formatter = StreamingReplyFormatter()
+    out, i = [], 0
+    while i < len(text):
+        n = rng.randint(1, 8)
+        out.append(formatter.feed(text[i:i + n]))
+        i += n
+    out.append(formatter.flush())
+    return "".join(out)
+
+
+def test_streamed_output_matches_format_llm_reply():
+    rng = random.Random(1234)
+    for _ in range(3000):
+        text = "".join(rng.choice(ATOMS) for _ in range(rng.randint(0, 30)))
+        assert _stream(text, rng) == format_llm_reply(text), repr(text)
+
+
+def test_single_piece_and_empty_reply():
+    text = "Intro **Benefits** * one * two\n\n\n\n• three  "
+    formatter = StreamingReplyFormatter()
+    assert formatter.feed(text) + formatter.flush() == format_llm_reply(text)
+
+    formatter = StreamingReplyFormatter()
+    assert formatter.flush() == format_llm_reply("") == ""
+
+
+def test_unclosed_heading_is_released_after_the_cap():
+    formatter = StreamingReplyFormatter()
+    pieces = ["Intro **Note that"] + [f" word{i}" for i in range(3000)]
+    out = [formatter.feed(piece) for piece in pieces]
+    # Held back only until the bold text is too long to be a heading
+    assert sum(map(len, out)) > len("".join(pieces)) - HEADING_SPAN
+    assert "".join(out) + formatter.flush() == format_llm_reply("".join(pieces))
@@ -0,0 +1,38 @@
+import tracemalloc
+
+import numpy as np
+
+from retrieval import TOP_K_BLOCK, top_k_indices
+
+
+def test_top_k_indices_matches_a_full_sort():
+    rng = np.random.default_rng(0)
+    for n in (1, 7, 1000, 3 * TOP_K_BLOCK + 5):
+        scores = rng.standard_normal(n).astype(np.float32)
+        best = np.sort(scores)[::-1]
+        for k in (1, 3, 40, TOP_K_BLOCK + 1, n - 1, n, n + 5):
+            top = top_k_indices(scores, k)
+            assert np.array_equal(scores[top], best[:k])
+        # Ascending scores: every block replaces the running top k
+        top = top_k_indices(np.sort(scores), 5)
+        assert np.array_equal(np.sort(scores)[top], best[:5])
+
+
+def test_top_k_indices_leaves_scores_alone():
+    scores = np.array([0.1, 0.9, 0.5, 0.7], dtype=np.float32)
+    before = scores.copy()
+    assert top_k_indices(scores, 2).tolist() == [1, 3]
+    assert top_k_indices(scores, 0).tolist() == []
+    assert np.array_equal(scores, before)
+
+
+def test_top_k_indices_memory_does_not_grow_with_n():
+    scores = np.random.default_rng(1).standard_normal(1_000_000).astype(np.float32)
+    tracemalloc.start()
+    try:
+        top_k_indices(scores, 40)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # Whole-array argpartition alone would allocate 8 MB of indices
+    assert peak < 16 * TOP_K_BLOCK * 8
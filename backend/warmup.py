@@ -0,0 +1,124 @@
+"""
+Keep the Ollama models loaded, so no request pays the model-load cost.
+
+ModelWarmer loads the embedding and chat models with one small call each
+(the chat call is laid out like a real question, so the fixed system prompt
+is in Ollama's prompt cache before the first one), then polls Ollama's list of
+loaded models (/api/ps) and warms a model again if Ollama evicted it, e.g.
+after an Ollama restart or when another model needed the memory.
+
+main.py runs it from the FastAPI lifespan; /readyz reports `ready`.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY, Counter
+from ollama_api.ollama_client import OllamaService
+
+MODEL_WARMUPS = REGISTRY.register(Counter(
+    "hr_model_warmups", "Model warm-up calls.", ("model", "result")))
+
+
+def _model_name(name: str) -> str:
+    """Ollama's full model name: "nomic-embed-text" -> "nomic-embed-text:latest"."""
+    return name if ":" in name else name + ":latest"
+
+
+class ModelWarmer:
+    """
+    Warm-up and eviction watch for the embedding and chat models.
+
+    Args:
+        service: The shared OllamaService (its keep_alive decides how long
+                 Ollama keeps the models loaded).
+        chat_messages: Messages of the chat warm-up call (one token is
+                       generated); default a bare "Hi".
+        check_interval: Seconds between /api/ps checks once warm.
+        retry_interval: Seconds between attempts while a model is cold.
+    """
+
+    def __init__(
+        self,
+        service: OllamaService,
+        chat_messages: Optional[List[dict]] = None,
+        check_interval: float = 30.0,
+        retry_interval: float = 5.0,
+    ):
+        self.service = service
+        self.chat_messages = chat_messages or [{"role": "user", "content": "Hi"}]
+        self.check_interval = check_interval
+        self.retry_interval = retry_interval
+        self.warm: Dict[str, bool] = {
+            service.embed_model: False,
+            service.chat_model: False,
+        }
+        self.last_error: Optional[str] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(self.warm.values())
+
+    def status(self) -> dict:
+        """Per-model state for /readyz."""
+        out = {"models": dict(self.warm)}
+        if self.last_error and not self.ready:
+            out["last_error"] = self.last_error
+        return out
+
+    async def _warm_embed(self) -> None:
+        await self.service.embed("warm-up")
+
+    async def _warm_chat(self) -> None:
+        await self.service.chat(self.chat_messages, options={"num_predict": 1})
+
+    async def warm_up(self, models: Optional[List[str]] = None) -> bool:
+        """
+        Load the given models (default: the cold ones) with one call each.
+
+        Returns:
+            True if every model is warm afterwards.
+        """
+        calls = {
+            self.service.embed_model: self._warm_embed,
+            self.service.chat_model: self._warm_chat,
+        }
+        for model in models or [m for m, warm in self.warm.items() if not warm]:
+            start = time.perf_counter()
+            try:
+                await calls[model]()
+            except Exception as e:
+                self.warm[model] = False
+                self.last_error = f"{model}: {e!r}"
+                MODEL_WARMUPS.inc(model=model, result="failed")
+                print(f"❌ Warm-up of {model} failed: {e!r}")
+                continue
+            self.warm[model] = True
+            MODEL_WARMUPS.inc(model=model, result="ok")
+            print(f"🔥 Warmed up {model} in {time.perf_counter() - start:.1f}s")
+        return self.ready
+
+    async def evicted(self) -> List[str]:
+        """Models Ollama no longer has loaded (per /api/ps)."""
+        loaded = {_model_name(m) for m in await self.service.loaded_models()}
+        return [m for m in self.warm if _model_name(m) not in loaded]
+
+    async def run(self) -> None:
+        """Warm up, then re-warm evicted models; runs until cancelled."""
+        while True:
+            if not self.ready:
+                if not await self.warm_up():
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+            if self.check_interval <= 0:
+                return
+            await asyncio.sleep(self.check_interval)
+            try:
+                cold = await self.evicted()
+            except Exception as e:
+                # Ollama unreachable: the models are gone too, for all we know
+                print(f"❌ Could not list loaded Ollama models: {e!r}")
+                cold = list(self.warm)
+            for model in cold:
+                print(f"🥶 {model} is not loaded any more, warming it up again")
+                self.warm[model] = False